@@ -0,0 +1,420 @@
+"""
+Admission control for analytics_backend project.
+
+Uploads, statistics, trends and charts keep a worker thread busy with pandas and matplotlib for a long time,
+so only a few of them run at once, in total and per user. The next ones wait in a bounded queue
+and are rejected with 429 and a Retry-After header when the queue is full or their wait times out,
+so the worker threads stay available for the light endpoints.
+
+With PostgreSQL the slots are advisory locks, so the limits apply to all the worker processes and
+servers together, and the locks of a crashed worker are released with its connection. With other
+databases the slots are kept in the process. The counters are kept in the cache ADMISSION_CACHE_ALIAS,
+which must be shared by the workers (e.g. redis or memcached) for /api/v1/admission/ to report all of them.
+"""
+
+import functools
+import threading
+import time
+from collections import Counter
+from typing import Callable, Optional
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection
+from django.http import HttpRequest, HttpResponse, JsonResponse
+from rest_framework import status
+from rest_framework.permissions import IsAdminUser
+from rest_framework.views import APIView
+
+# seconds between two attempts of a waiting request to get a slot
+POLL_INTERVAL = 0.05
+
+# first key of the advisory locks, the global slots use it, the queue slots the next one and the user slots the ones after
+LOCK_CLASS_GLOBAL = 0x61646d00
+LOCK_CLASS_QUEUE = LOCK_CLASS_GLOBAL + 1
+LOCK_CLASS_USER = LOCK_CLASS_GLOBAL + 2
+# upper bound of ADMISSION_MAX_CONCURRENT_PER_USER, which keeps the user slots in a known range of keys
+MAX_USER_SLOTS = 1000
+
+COUNTER_NAMES = ('admitted', 'queued', 'wait_milliseconds', 'rejected_queue_full', 'rejected_timeout')
+COUNTER_KEY_PREFIX = 'admission:'
+
+
+class LocalSlots:
+    """
+    Slots of the requests running and waiting in this process
+    """
+
+    def __init__(self) -> None:
+        self._condition = threading.Condition()
+        self._running = 0
+        self._running_per_user: Counter[int] = Counter()
+        self._waiting = 0
+
+    def try_acquire(self, user_id: int) -> bool:
+        """
+        Take a global and a user slot if both are free
+        """
+        with self._condition:
+            if (self._running >= settings.ADMISSION_MAX_CONCURRENT
+                    or self._running_per_user[user_id] >= settings.ADMISSION_MAX_CONCURRENT_PER_USER):
+                return False
+
+            self._running += 1
+            self._running_per_user[user_id] += 1
+            return True
+
+    def release(self, user_id: int) -> None:
+        """
+        Free the slots of a finished request and wake up the waiting requests
+        """
+        with self._condition:
+            self._running -= 1
+            self._running_per_user[user_id] -= 1
+            if self._running_per_user[user_id] <= 0:
+                del self._running_per_user[user_id]
+
+            # the waiting requests have different users, so all of them check if they can run now
+            self._condition.notify_all()
+
+    def try_enter_queue(self) -> bool:
+        """
+        Take a place in the wait queue if it is not full
+        """
+        with self._condition:
+            if self._waiting >= settings.ADMISSION_MAX_QUEUE:
+                return False
+
+            self._waiting += 1
+            return True
+
+    def leave_queue(self) -> None:
+        """
+        Free the place of a request in the wait queue
+        """
+        with self._condition:
+            self._waiting -= 1
+
+    def wait(self, timeout: float) -> None:
+        """
+        Wait until a request finishes or the timeout elapses
+        """
+        with self._condition:
+            self._condition.wait(timeout)
+
+    def get_state(self) -> dict[str, int]:
+        """
+        Get the number of running requests, of users with running requests and of waiting requests
+        """
+        with self._condition:
+            return {
+                'running': self._running,
+                'running_users': len(self._running_per_user),
+                'queue_depth': self._waiting,
+            }
+
+
+class DatabaseSlots:
+    """
+    Slots shared by every process which uses the database, held as PostgreSQL session advisory locks.
+
+    Every slot is a lock key: (LOCK_CLASS_GLOBAL, slot) for the global slots, (LOCK_CLASS_QUEUE, slot)
+    for the places in the queue and (LOCK_CLASS_USER + slot, user id) for the user slots. A request takes
+    the first free slot of each kind. The session locks are re-entrant, so the keys a thread holds on its
+    connection are remembered per thread, skipped when it takes another slot and unlocked on release.
+    """
+
+    # takes the first slot whose lock is free, the locks are tried in order and the scan stops at the first success
+    FREE_SLOT_SQL = """
+        SELECT slot FROM unnest(%s::integer[]) slot
+        WHERE pg_try_advisory_lock({class_id}, {object_id})
+        LIMIT 1
+    """
+
+    def __init__(self) -> None:
+        self._held = threading.local()
+
+    def try_acquire(self, user_id: int) -> bool:
+        """
+        Take a global and a user slot if both are free
+        """
+        held_keys = self.get_held_keys()
+        user_slot = self.lock_free_slot(
+            [slot for slot in range(min(settings.ADMISSION_MAX_CONCURRENT_PER_USER, MAX_USER_SLOTS))
+             if (LOCK_CLASS_USER + slot, user_id) not in held_keys],
+            '%s + slot', '%s', [LOCK_CLASS_USER, user_id]
+        )
+        if user_slot is None:
+            return False
+
+        global_slot = self.lock_free_slot(
+            [slot for slot in range(settings.ADMISSION_MAX_CONCURRENT) if (LOCK_CLASS_GLOBAL, slot) not in held_keys],
+            '%s', 'slot', [LOCK_CLASS_GLOBAL]
+        )
+        if global_slot is None:
+            self.unlock(LOCK_CLASS_USER + user_slot, user_id)
+            return False
+
+        held_keys.extend([(LOCK_CLASS_USER + user_slot, user_id), (LOCK_CLASS_GLOBAL, global_slot)])
+        return True
+
+    def release(self, user_id: int) -> None:
+        """
+        Unlock the slots of a finished request, the last ones the thread took for the user
+        """
+        held_keys = self.get_held_keys()
+        user_keys = [key for key in held_keys if LOCK_CLASS_USER <= key[0] < LOCK_CLASS_USER + MAX_USER_SLOTS
+                     and key[1] == user_id]
+        global_keys = [key for key in held_keys if key[0] == LOCK_CLASS_GLOBAL]
+
+        # the slots may be gone with a closed connection, which unlocked them already
+        for keys in (user_keys, global_keys):
+            if keys:
+                held_keys.remove(keys[-1])
+                self.unlock(*keys[-1])
+
+    def try_enter_queue(self) -> bool:
+        """
+        Take a place in the wait queue if it is not full
+        """
+        held_keys = self.get_held_keys()
+        queue_slot = self.lock_free_slot(
+            [slot for slot in range(settings.ADMISSION_MAX_QUEUE) if (LOCK_CLASS_QUEUE, slot) not in held_keys],
+            '%s', 'slot', [LOCK_CLASS_QUEUE]
+        )
+        if queue_slot is None:
+            return False
+
+        held_keys.append((LOCK_CLASS_QUEUE, queue_slot))
+        return True
+
+    def leave_queue(self) -> None:
+        """
+        Free the place of a request in the wait queue
+        """
+        held_keys = self.get_held_keys()
+        queue_keys = [key for key in held_keys if key[0] == LOCK_CLASS_QUEUE]
+        if queue_keys:
+            held_keys.remove(queue_keys[-1])
+            self.unlock(*queue_keys[-1])
+
+    def wait(self, timeout: float) -> None:
+        """
+        Wait before the next attempt, the other processes can't notify this one
+        """
+        time.sleep(timeout)
+
+    def get_state(self) -> dict[str, int]:
+        """
+        Get the number of running requests, of users with running requests and of waiting requests of all the processes
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """
+                SELECT count(*) FILTER (WHERE classid = %s),
+                       count(DISTINCT objid) FILTER (WHERE classid >= %s AND classid < %s),
+                       count(*) FILTER (WHERE classid = %s)
+                FROM pg_locks
+                WHERE locktype = 'advisory' AND granted AND objsubid = 2
+                  AND database = (SELECT oid FROM pg_database WHERE datname = current_database())
+                """,
+                [LOCK_CLASS_GLOBAL, LOCK_CLASS_USER, LOCK_CLASS_USER + MAX_USER_SLOTS, LOCK_CLASS_QUEUE]
+            )
+            running, running_users, queue_depth = cursor.fetchone()
+
+        return {'running': running, 'running_users': running_users, 'queue_depth': queue_depth}
+
+    def get_held_keys(self) -> list[tuple[int, int]]:
+        """
+        Get the lock keys which the thread holds on its connection
+        """
+        if not hasattr(self._held, 'keys'):
+            self._held.keys = []
+
+        return self._held.keys
+
+    def lock_free_slot(self, slots: list[int], class_id: str, object_id: str, params: list[int]) -> Optional[int]:
+        """
+        Lock the first free slot of the ones provided, where class_id and object_id are the SQL expressions of the lock key
+        """
+        if not slots:
+            return None
+
+        with connection.cursor() as cursor:
+            cursor.execute(self.FREE_SLOT_SQL.format(class_id=class_id, object_id=object_id), [slots, *params])
+            row = cursor.fetchone()
+
+        return None if row is None else row[0]
+
+    def unlock(self, class_id: int, object_id: int) -> None:
+        """
+        Unlock one slot
+        """
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_unlock(%s, %s)', [class_id, object_id])
+
+
+class AdmissionCounters:
+    """
+    Counters of the admitted and rejected requests, in the cache ADMISSION_CACHE_ALIAS or else in the process
+    """
+
+    def __init__(self) -> None:
+        self._counters: Counter[str] = Counter()
+        self._lock = threading.Lock()
+
+    def increment(self, name: str, value: int = 1) -> None:
+        """
+        Add a value to a counter
+        """
+        shared_cache = self.get_shared_cache()
+        if shared_cache is None:
+            with self._lock:
+                self._counters[name] += value
+            return
+
+        key = COUNTER_KEY_PREFIX + name
+        # incr is atomic, but fails when the key doesn't exist yet
+        shared_cache.add(key, 0, timeout=None)
+        try:
+            shared_cache.incr(key, value)
+        except ValueError:
+            shared_cache.set(key, value, timeout=None)
+
+    def get(self) -> dict[str, int]:
+        """
+        Get the value of every counter
+        """
+        shared_cache = self.get_shared_cache()
+        if shared_cache is None:
+            with self._lock:
+                return {name: self._counters[name] for name in COUNTER_NAMES}
+
+        values = shared_cache.get_many([COUNTER_KEY_PREFIX + name for name in COUNTER_NAMES])
+        return {name: values.get(COUNTER_KEY_PREFIX + name, 0) for name in COUNTER_NAMES}
+
+    def reset(self) -> None:
+        """
+        Clear the counters
+        """
+        with self._lock:
+            self._counters.clear()
+
+        shared_cache = self.get_shared_cache()
+        if shared_cache is not None:
+            shared_cache.delete_many([COUNTER_KEY_PREFIX + name for name in COUNTER_NAMES])
+
+    def get_shared_cache(self):
+        """
+        Get the Django cache used for the counters, if one is configured
+        """
+        if not settings.ADMISSION_CACHE_ALIAS:
+            return None
+
+        return caches[settings.ADMISSION_CACHE_ALIAS]
+
+
+class AdmissionController:
+    """
+    Concurrency limits with a global and a per-user limit and a bounded wait queue
+    """
+
+    def __init__(self) -> None:
+        self.local_slots = LocalSlots()
+        self.database_slots = DatabaseSlots()
+        self.counters = AdmissionCounters()
+
+    def get_slots(self):
+        """
+        Get the slots shared through the database when it is PostgreSQL, or else the slots of the process
+        """
+        return self.database_slots if connection.vendor == 'postgresql' else self.local_slots
+
+    def acquire(self, user_id: int) -> Optional[str]:
+        """
+        Wait for a slot for the user. Returns None when the request is admitted, or the reason of the rejection
+        """
+        slots = self.get_slots()
+
+        if not slots.try_acquire(user_id):
+            if not slots.try_enter_queue():
+                self.counters.increment('rejected_queue_full')
+                return 'queue_full'
+
+            started_at = time.monotonic()
+            deadline = started_at + settings.ADMISSION_QUEUE_TIMEOUT
+            is_admitted = False
+            try:
+                while not is_admitted and time.monotonic() < deadline:
+                    slots.wait(min(POLL_INTERVAL, max(0.0, deadline - time.monotonic())))
+                    is_admitted = slots.try_acquire(user_id)
+            finally:
+                slots.leave_queue()
+
+            self.counters.increment('wait_milliseconds', int((time.monotonic() - started_at) * 1000))
+            if not is_admitted:
+                self.counters.increment('rejected_timeout')
+                return 'timeout'
+
+            self.counters.increment('queued')
+
+        self.counters.increment('admitted')
+
+        return None
+
+    def release(self, user_id: int) -> None:
+        """
+        Free the slots of a finished request
+        """
+        self.get_slots().release(user_id)
+
+    def get_stats(self) -> dict[str, int]:
+        """
+        Get the current state of the slots and the counters
+        """
+        return {**self.get_slots().get_state(), **self.counters.get()}
+
+    def reset(self) -> None:
+        """
+        Clear the counters, the running and the waiting requests are kept
+        """
+        self.counters.reset()
+
+
+admission_controller = AdmissionController()
+
+
+def admission_controlled(view_method: Callable[..., HttpResponse]) -> Callable[..., HttpResponse]:
+    """
+    Decorator for the view methods which run only when the admission controller admits the request
+    """
+    @functools.wraps(view_method)
+    def wrapper(self, request: HttpRequest, *args, **kwargs) -> HttpResponse:
+        user_id = request.user.id
+
+        rejection = admission_controller.acquire(user_id)
+        if rejection is not None:
+            response = JsonResponse({'error': 'The server is busy, please retry later'},
+                                    status=status.HTTP_429_TOO_MANY_REQUESTS)
+            response['Retry-After'] = str(settings.ADMISSION_RETRY_AFTER)
+            return response
+
+        try:
+            return view_method(self, request, *args, **kwargs)
+        finally:
+            admission_controller.release(user_id)
+
+    return wrapper
+
+
+class AdmissionStatsView(APIView):
+    """
+    View which shows the admission control state and counters
+    """
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request: HttpRequest) -> JsonResponse:
+        """
+        Get the running requests, the queue depth and the admission and rejection counters
+        """
+        return JsonResponse(admission_controller.get_stats())
@@ -35,6 +35,56 @@ os.environ["DJANGO_ALLOW_ASYNC_UNSAFE"] = "true"
 MEDIA_ROOT = '/visualizations/'
 MEDIA_URL = '/visualizations/'
 
+# How the chart files are transferred: 'x-accel-redirect' (nginx), 'x-sendfile' (apache) or empty to stream them
+CHART_FILE_SENDFILE = os.environ.get('CHART_FILE_SENDFILE', '')
+# Internal location which nginx maps to MEDIA_ROOT when X-Accel-Redirect is used
+CHART_FILE_ACCEL_REDIRECT_PREFIX = os.environ.get('CHART_FILE_ACCEL_REDIRECT_PREFIX', '/protected-visualizations/')
+# Chart files never change, so browsers can keep them for a year
+CHART_FILE_MAX_AGE = 365 * 24 * 60 * 60
+# Maximum number of pixels of a chart, larger figures are scaled down so the rendering memory stays bounded
+CHART_MAX_PIXELS = int(os.environ.get('CHART_MAX_PIXELS', 25_000_000))
+# Maximum width and height in pixels of the chart thumbnails
+CHART_THUMBNAIL_SIZE = (480, 240)
+
+# Authenticated tokens are cached for at most this many seconds, which bounds how long a logout
+# takes to reach the other worker processes
+TOKEN_CACHE_TTL = int(os.environ.get('TOKEN_CACHE_TTL', 30))
+# Maximum number of tokens cached in every process
+TOKEN_CACHE_MAX_SIZE = int(os.environ.get('TOKEN_CACHE_MAX_SIZE', 10000))
+# Alias of the Django cache which is shared between the processes, e.g. redis or memcached
+TOKEN_CACHE_ALIAS = os.environ.get('TOKEN_CACHE_ALIAS')
+
+# Statistics are calculated in a process pool when the data has at least this many rows
+STATISTICS_PARALLEL_MIN_ROWS = int(os.environ.get('STATISTICS_PARALLEL_MIN_ROWS', 500000))
+# Number of processes used for the statistics, defaults to the number of cores
+STATISTICS_MAX_WORKERS = int(os.environ.get('STATISTICS_MAX_WORKERS', 0))
+# Directory of the memory-mapped column store of the csv data, the store is disabled when not set
+CSVDATA_COLUMN_STORE_ROOT = os.environ.get('CSVDATA_COLUMN_STORE_ROOT')
+# Number of months of csv data kept in the database by the archive_csvdata_partitions command
+CSVDATA_RETENTION_MONTHS = int(os.environ.get('CSVDATA_RETENTION_MONTHS', 36))
+# Maximum size in bytes of an uploaded csv data body, before decompression. The upload is read from the
+# request stream, so DATA_UPLOAD_MAX_MEMORY_SIZE doesn't apply to it
+CSVDATA_UPLOAD_MAX_SIZE = int(os.environ.get('CSVDATA_UPLOAD_MAX_SIZE', 512 * 1024 * 1024))
+# Maximum size in bytes of a compressed csv data body after decompression, which is read in memory
+CSVDATA_UPLOAD_MAX_DECOMPRESSED_SIZE = int(os.environ.get('CSVDATA_UPLOAD_MAX_DECOMPRESSED_SIZE', 1024 * 1024 * 1024))
+# Directory where the archived partitions of the csv data are written
+CSVDATA_ARCHIVE_ROOT = os.environ.get('CSVDATA_ARCHIVE_ROOT', '/archive/csvdata/')
+
+# Admission control of the uploads, statistics, trends and charts, the limits are shared by the worker processes with PostgreSQL
+# Maximum number of those requests running at once
+ADMISSION_MAX_CONCURRENT = int(os.environ.get('ADMISSION_MAX_CONCURRENT', 4))
+# Maximum number of those requests running at once for one user
+ADMISSION_MAX_CONCURRENT_PER_USER = int(os.environ.get('ADMISSION_MAX_CONCURRENT_PER_USER', 2))
+# Maximum number of requests waiting for a slot, the next ones are rejected with 429
+ADMISSION_MAX_QUEUE = int(os.environ.get('ADMISSION_MAX_QUEUE', 8))
+# Seconds a request waits for a slot before it is rejected with 429
+ADMISSION_QUEUE_TIMEOUT = float(os.environ.get('ADMISSION_QUEUE_TIMEOUT', 5))
+# Seconds sent in the Retry-After header of the rejected requests
+ADMISSION_RETRY_AFTER = int(os.environ.get('ADMISSION_RETRY_AFTER', 10))
+# Alias of a cache shared by the workers (e.g. redis or memcached) which keeps the admission counters,
+# without it every worker counts its own requests
+ADMISSION_CACHE_ALIAS = os.environ.get('ADMISSION_CACHE_ALIAS')
+
 INSTALLED_APPS = [
     'django.contrib.admin',
     'django.contrib.auth',
@@ -141,7 +191,7 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 REST_FRAMEWORK = {
     'EXCEPTION_HANDLER': 'rest_framework_json_api.exceptions.exception_handler',
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'knox.auth.TokenAuthentication',
+        'apps.users.authentication.CachedTokenAuthentication',
     ],
     'DEFAULT_RENDERER_CLASSES': (
         'rest_framework_json_api.renderers.JSONRenderer',
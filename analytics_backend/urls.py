@@ -4,7 +4,7 @@ from rest_framework import routers
 from apps.csvdata import views as csvdata_views
 from apps.visualizations import views as visualization_views
 from django.conf import settings
-from django.conf.urls.static import static
+from analytics_backend.admission import AdmissionStatsView
 
 router = routers.DefaultRouter()
 router.register(r'csvdata', csvdata_views.CsvDataViewSet, basename='csvdata')
@@ -13,5 +13,7 @@ router.register(r'visualizations', visualization_views.VisualizationViewSet, bas
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/v1/', include('apps.users.urls')),
-    path('api/v1/', include(router.urls))
-] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+    path('api/v1/', include(router.urls)),
+    path('api/v1/admission/', AdmissionStatsView.as_view(), name='admission-stats'),
+    path(settings.MEDIA_URL.lstrip('/') + '<path:file_name>', visualization_views.ChartFileView.as_view(), name='chart-file')
+]
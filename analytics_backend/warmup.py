@@ -0,0 +1,39 @@
+"""
+Warm-up of the analytics dependencies for analytics_backend project.
+
+The views import pandas, numpy and matplotlib on first use, so the management commands and the
+endpoints which don't analyse data start quickly. The web workers call warm_up() instead, so the
+first upload, statistics or chart request doesn't pay for the imports and the font loading.
+"""
+
+import io
+import threading
+
+_lock = threading.Lock()
+_is_warmed_up = False
+
+
+def warm_up() -> None:
+    """
+    Import the analytics modules and render a small chart, so matplotlib loads its font cache and fonts.
+    Does nothing after the first call, which includes the workers forked from a warmed up process
+    """
+    global _is_warmed_up
+
+    with _lock:
+        if _is_warmed_up:
+            return
+
+        import apps.csvdata.column_store  # noqa: F401
+        import apps.csvdata.utils  # noqa: F401
+        from apps.visualizations.utils import create_figure
+
+        # drawing text loads the font files, and saving loads the Agg renderer
+        fig = create_figure(figsize=(1, 1))
+        ax = fig.subplots()
+        ax.plot([0, 1], [0, 1], label='warm up')
+        ax.set_title('warm up')
+        ax.legend()
+        fig.savefig(io.BytesIO(), format='png')
+
+        _is_warmed_up = True
@@ -0,0 +1,222 @@
+import fcntl
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+from datetime import date
+from typing import Iterator, Optional
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.contrib.auth.models import User
+
+from .models import CSVData, Team
+
+# the files of the column store, one numpy array per file
+COLUMN_NAMES = ('date', 'team_codes', 'teams', 'team_ids', 'review_time', 'merge_time')
+# the columns which hold the team dictionary instead of one value per row
+DICTIONARY_COLUMN_NAMES = ('teams', 'team_ids')
+
+Columns = dict[str, np.ndarray]
+
+
+class ColumnStore:
+    """
+    Handler class which contains static methods to manage the on-disk columnar cache of the csv data.
+
+    Every user has a directory with one .npy file per column, sorted by date. The teams are
+    dictionary encoded: team_codes holds the index in teams (the names sorted alphabetically)
+    and team_ids (the ids of the Team rows) for every row. The files are loaded
+    memory-mapped, so the workers of a deployment share the pages through the OS page cache.
+    The cache is optional and only used when CSVDATA_COLUMN_STORE_ROOT is set.
+    """
+
+    @staticmethod
+    def is_enabled() -> bool:
+        """
+        Check if the column store is configured
+        """
+        return bool(settings.CSVDATA_COLUMN_STORE_ROOT)
+
+    @staticmethod
+    def load_columns(user: User, start_date: Optional[date] = None, end_date: Optional[date] = None) -> Columns:
+        """
+        Get the columns of the user's csv data between the dates provided (inclusive), from the column store if possible
+        """
+        if not ColumnStore.is_enabled():
+            # the date bounds let PostgreSQL scan only the partitions of those months
+            return ColumnStore.read_columns_from_db(user, start_date, end_date)
+
+        columns = ColumnStore.load(user.id)
+        if columns is None:
+            with ColumnStore.user_lock(user.id):
+                # another worker may have built the columns while waiting for the lock
+                columns = ColumnStore.load_files(user.id)
+                if columns is None:
+                    # an inconsistent set of files is replaced as well
+                    ColumnStore.remove(user.id)
+                    ColumnStore.write(user.id, ColumnStore.read_columns_from_db(user))
+                    columns = ColumnStore.load_files(user.id)
+
+        return ColumnStore.filter_dates(columns, start_date, end_date)
+
+    @staticmethod
+    def refresh(user: User) -> None:
+        """
+        Rebuild the columns of the user after the csv data has been changed
+        """
+        if not ColumnStore.is_enabled():
+            return
+
+        with ColumnStore.user_lock(user.id):
+            ColumnStore.remove(user.id)
+            ColumnStore.write(user.id, ColumnStore.read_columns_from_db(user))
+
+    @staticmethod
+    def invalidate(user_id: int) -> None:
+        """
+        Remove the columns of the user, they will be rebuilt on the next read
+        """
+        if not ColumnStore.is_enabled():
+            return
+
+        with ColumnStore.user_lock(user_id):
+            ColumnStore.remove(user_id)
+
+    @staticmethod
+    def read_columns_from_db(user: User, start_date: Optional[date] = None, end_date: Optional[date] = None) -> Columns:
+        """
+        Query the csv data of the user and convert it to columns
+        """
+        csv_data = CSVData.objects.filter(user=user).order_by('date')
+        if start_date is not None:
+            csv_data = csv_data.filter(date__gte=start_date)
+        if end_date is not None:
+            csv_data = csv_data.filter(date__lte=end_date)
+        csv_data = csv_data.values_list('date', 'team_id', 'review_time', 'merge_time')
+        df = pd.DataFrame(list(csv_data), columns=['date', 'team_id', 'review_time', 'merge_time'])
+
+        # the teams are read after the rows, so the teams of rows committed in between are included.
+        # Teams are only added, so every row read above has its team in the dictionary
+        teams = list(Team.objects.filter(user=user).order_by('name').values_list('id', 'name'))
+        team_ids = np.array([team_id for team_id, _ in teams], dtype=np.int64)
+
+        return {
+            'date': df['date'].to_numpy(dtype='datetime64[D]'),
+            'team_codes': pd.Index(team_ids).get_indexer(df['team_id']).astype(np.int32),
+            'teams': np.array([name for _, name in teams], dtype=str),
+            'team_ids': team_ids,
+            'review_time': df['review_time'].to_numpy(dtype=np.int64),
+            'merge_time': df['merge_time'].to_numpy(dtype=np.int64),
+        }
+
+    @staticmethod
+    def filter_team(columns: Columns, team: str) -> Columns:
+        """
+        Keep only the rows of one team
+        """
+        mask = np.isin(columns['team_codes'], np.flatnonzero(columns['teams'] == team))
+
+        return {name: (values if name in DICTIONARY_COLUMN_NAMES else values[mask]) for name, values in columns.items()}
+
+    @staticmethod
+    def filter_dates(columns: Columns, start_date: Optional[date], end_date: Optional[date]) -> Columns:
+        """
+        Keep only the rows between the dates provided (inclusive). The rows are sorted by date, so the result is a view
+        """
+        start = 0
+        end = len(columns['date'])
+        if start_date is not None:
+            start = np.searchsorted(columns['date'], np.datetime64(start_date, 'D'), side='left')
+        if end_date is not None:
+            end = np.searchsorted(columns['date'], np.datetime64(end_date, 'D'), side='right')
+
+        return {name: (values if name in DICTIONARY_COLUMN_NAMES else values[start:end]) for name, values in columns.items()}
+
+    @staticmethod
+    def to_data_frame(columns: Columns) -> pd.DataFrame:
+        """
+        Create a data frame from the columns, with the team as a categorical column
+        """
+        return pd.DataFrame({
+            'review_time': columns['review_time'],
+            'merge_time': columns['merge_time'],
+            'date': columns['date'],
+            'team': pd.Categorical.from_codes(columns['team_codes'], categories=columns['teams']),
+        })
+
+    @staticmethod
+    def load(user_id: int) -> Optional[Columns]:
+        """
+        Load the memory-mapped columns of the user, or None if they are not cached. The shared lock keeps
+        a rebuild from replacing the files while they are opened, so all the columns come from the same version
+        """
+        with ColumnStore.user_lock(user_id, shared=True):
+            return ColumnStore.load_files(user_id)
+
+    @staticmethod
+    def load_files(user_id: int) -> Optional[Columns]:
+        """
+        Open the column files of the user, which must be called with the lock of the user held
+        """
+        directory = ColumnStore.user_directory(user_id)
+        try:
+            columns = {
+                name: np.load(os.path.join(directory, f'{name}.npy'), mmap_mode='r')
+                for name in COLUMN_NAMES
+            }
+        except FileNotFoundError:
+            return None
+
+        # the mapped files stay readable after a rebuild removes them, but a partial set must not be used
+        row_counts = {len(values) for name, values in columns.items() if name not in DICTIONARY_COLUMN_NAMES}
+        dictionary_sizes = {len(columns[name]) for name in DICTIONARY_COLUMN_NAMES}
+        if len(row_counts) != 1 or len(dictionary_sizes) != 1:
+            return None
+
+        return columns
+
+    @staticmethod
+    def write(user_id: int, columns: Columns) -> None:
+        """
+        Write the columns in a temporary directory and move it in place, so readers never see partial files
+        """
+        temp_directory = tempfile.mkdtemp(dir=settings.CSVDATA_COLUMN_STORE_ROOT, prefix=f'.{user_id}-')
+        for name in COLUMN_NAMES:
+            np.save(os.path.join(temp_directory, f'{name}.npy'), columns[name])
+
+        os.rename(temp_directory, ColumnStore.user_directory(user_id))
+
+    @staticmethod
+    def remove(user_id: int) -> None:
+        """
+        Remove the directory of the user. Readers which have already mapped the files keep their views
+        """
+        directory = ColumnStore.user_directory(user_id)
+        if not os.path.isdir(directory):
+            return
+
+        # move the directory away first, so it disappears atomically for the other workers
+        trash_directory = tempfile.mkdtemp(dir=settings.CSVDATA_COLUMN_STORE_ROOT, prefix=f'.{user_id}-')
+        os.rename(directory, os.path.join(trash_directory, 'columns'))
+        shutil.rmtree(trash_directory)
+
+    @staticmethod
+    def user_directory(user_id: int) -> str:
+        """
+        Get the directory which holds the columns of the user
+        """
+        return os.path.join(settings.CSVDATA_COLUMN_STORE_ROOT, str(user_id))
+
+    @staticmethod
+    @contextmanager
+    def user_lock(user_id: int, shared: bool = False) -> Iterator[None]:
+        """
+        Lock the columns of the user across processes, exclusively while they are rebuilt and shared while they are opened
+        """
+        os.makedirs(settings.CSVDATA_COLUMN_STORE_ROOT, exist_ok=True)
+
+        with open(os.path.join(settings.CSVDATA_COLUMN_STORE_ROOT, f'{user_id}.lock'), 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            yield
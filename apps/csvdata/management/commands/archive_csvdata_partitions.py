@@ -0,0 +1,22 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from apps.csvdata.partitions import PartitionManager
+
+
+class Command(BaseCommand):
+    help = 'Archive the partitions of the csv data which are older than the retention period to compressed csv files'
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument('--retention-months', type=int, default=settings.CSVDATA_RETENTION_MONTHS,
+                            help='Number of months of csv data kept in the database')
+        parser.add_argument('--archive-dir', default=settings.CSVDATA_ARCHIVE_ROOT,
+                            help='Directory where the archived partitions are written')
+
+    def handle(self, *args, **options) -> None:
+        archived = PartitionManager.archive_partitions(options['retention_months'], options['archive_dir'])
+
+        for archive_path in archived:
+            self.stdout.write(f'Archived partition to {archive_path}')
+
+        self.stdout.write(self.style.SUCCESS(f'{len(archived)} partitions archived'))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from apps.csvdata.partitions import PartitionManager
+
+
+class Command(BaseCommand):
+    help = 'Create the monthly partitions of the csv data, moving the rows of those months out of the default partition'
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument('--months-ahead', type=int, default=3,
+                            help='Number of future months to create partitions for')
+
+    def handle(self, *args, **options) -> None:
+        created = PartitionManager.create_partitions(options['months_ahead'])
+
+        for name in created:
+            self.stdout.write(f'Created partition {name}')
+
+        self.stdout.write(self.style.SUCCESS(f'{len(created)} partitions created'))
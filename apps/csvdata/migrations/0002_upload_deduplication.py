@@ -0,0 +1,52 @@
+# Generated by Django 4.1.6 on 2026-10-19 13:52
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('csvdata', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UploadManifest',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('file_hash', models.CharField(max_length=64)),
+                ('row_count', models.PositiveIntegerField()),
+                ('uploaded_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        # remove the rows which were appended by repeated uploads, keeping the first copy
+        migrations.RunSQL(
+            sql="""
+                DELETE FROM csvdata_csvdata duplicate
+                USING csvdata_csvdata original
+                WHERE duplicate.id > original.id
+                  AND duplicate.user_id = original.user_id
+                  AND duplicate.team = original.team
+                  AND duplicate.date = original.date
+                  AND duplicate.review_time = original.review_time
+                  AND duplicate.merge_time = original.merge_time
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+        migrations.AddConstraint(
+            model_name='csvdata',
+            constraint=models.UniqueConstraint(fields=('user', 'team', 'date', 'review_time', 'merge_time'), name='csvdata_unique_row'),
+        ),
+        migrations.AddField(
+            model_name='uploadmanifest',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddConstraint(
+            model_name='uploadmanifest',
+            constraint=models.UniqueConstraint(fields=('user', 'file_hash'), name='uploadmanifest_unique_file'),
+        ),
+    ]
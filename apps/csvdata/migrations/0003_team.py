@@ -0,0 +1,76 @@
+# Generated by Django 4.1.6 on 2026-10-19 14:20
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('csvdata', '0002_upload_deduplication'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Team',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='team',
+            constraint=models.UniqueConstraint(fields=('user', 'name'), name='team_unique_name'),
+        ),
+        migrations.RemoveConstraint(
+            model_name='csvdata',
+            name='csvdata_unique_row',
+        ),
+        migrations.RenameField(
+            model_name='csvdata',
+            old_name='team',
+            new_name='team_name',
+        ),
+        migrations.AddField(
+            model_name='csvdata',
+            name='team',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='csvdata.team'),
+        ),
+        # create a team for every distinct team name of a user and point the rows to it
+        migrations.RunSQL(
+            sql=[
+                """
+                INSERT INTO csvdata_team (user_id, name)
+                SELECT DISTINCT user_id, team_name FROM csvdata_csvdata
+                """,
+                """
+                UPDATE csvdata_csvdata csv_row
+                SET team_id = team.id
+                FROM csvdata_team team
+                WHERE team.user_id = csv_row.user_id AND team.name = csv_row.team_name
+                """,
+            ],
+            reverse_sql="""
+                UPDATE csvdata_csvdata csv_row
+                SET team_name = team.name
+                FROM csvdata_team team
+                WHERE team.id = csv_row.team_id
+            """,
+        ),
+        migrations.AlterField(
+            model_name='csvdata',
+            name='team',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='csvdata.team'),
+        ),
+        migrations.RemoveField(
+            model_name='csvdata',
+            name='team_name',
+        ),
+        migrations.AddConstraint(
+            model_name='csvdata',
+            constraint=models.UniqueConstraint(fields=('user', 'team', 'date', 'review_time', 'merge_time'), name='csvdata_unique_row'),
+        ),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 4.1.6 on 2026-10-19 15:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    """
+    Convert the csv data table to a table partitioned by date range. Until monthly partitions are created
+    by the create_csvdata_partitions command, every row lives in the default partition.
+    """
+
+    dependencies = [
+        ('csvdata', '0003_team'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunSQL(
+                    sql=[
+                        "ALTER TABLE csvdata_csvdata RENAME TO csvdata_csvdata_unpartitioned",
+                        # constraint names are unique per schema, so the old ones are renamed out of the way
+                        "ALTER TABLE csvdata_csvdata_unpartitioned RENAME CONSTRAINT csvdata_csvdata_pkey TO csvdata_csvdata_unpartitioned_pkey",
+                        "ALTER TABLE csvdata_csvdata_unpartitioned RENAME CONSTRAINT csvdata_unique_row TO csvdata_unique_row_unpartitioned",
+                        "CREATE SEQUENCE csvdata_csvdata_partitioned_id_seq",
+                        # the partition key has to be part of the primary key and of the unique constraints
+                        """
+                        CREATE TABLE csvdata_csvdata (
+                            id bigint NOT NULL DEFAULT nextval('csvdata_csvdata_partitioned_id_seq'),
+                            review_time varchar(100) NOT NULL,
+                            date date NOT NULL,
+                            merge_time varchar(100) NOT NULL,
+                            team_id bigint NOT NULL,
+                            user_id integer NOT NULL,
+                            CONSTRAINT csvdata_csvdata_pkey PRIMARY KEY (id, date),
+                            CONSTRAINT csvdata_unique_row UNIQUE (user_id, team_id, date, review_time, merge_time),
+                            CONSTRAINT csvdata_csvdata_team_id_fk_csvdata_team_id FOREIGN KEY (team_id)
+                                REFERENCES csvdata_team (id) DEFERRABLE INITIALLY DEFERRED,
+                            CONSTRAINT csvdata_csvdata_user_id_fk_auth_user_id FOREIGN KEY (user_id)
+                                REFERENCES auth_user (id) DEFERRABLE INITIALLY DEFERRED
+                        ) PARTITION BY RANGE (date)
+                        """,
+                        "ALTER SEQUENCE csvdata_csvdata_partitioned_id_seq OWNED BY csvdata_csvdata.id",
+                        "CREATE TABLE csvdata_csvdata_default PARTITION OF csvdata_csvdata DEFAULT",
+                        "CREATE INDEX csvdata_user_date_idx ON csvdata_csvdata (user_id, date)",
+                        "CREATE INDEX csvdata_team_idx ON csvdata_csvdata (team_id)",
+                        """
+                        INSERT INTO csvdata_csvdata (id, review_time, date, merge_time, team_id, user_id)
+                        SELECT id, review_time, date, merge_time, team_id, user_id FROM csvdata_csvdata_unpartitioned
+                        """,
+                        """
+                        SELECT setval('csvdata_csvdata_partitioned_id_seq',
+                                      COALESCE((SELECT max(id) FROM csvdata_csvdata), 0) + 1, false)
+                        """,
+                        "DROP TABLE csvdata_csvdata_unpartitioned",
+                    ],
+                    reverse_sql=migrations.RunSQL.noop,
+                ),
+            ],
+            state_operations=[
+                migrations.AddIndex(
+                    model_name='csvdata',
+                    index=models.Index(fields=['user', 'date'], name='csvdata_user_date_idx'),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 4.1.6 on 2026-10-19 16:05
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('csvdata', '0004_partition_csvdata'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TeamDailyAggregate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('row_count', models.PositiveIntegerField()),
+                ('review_time_sum', models.BigIntegerField()),
+                ('merge_time_sum', models.BigIntegerField()),
+                ('team', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='csvdata.team')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='teamdailyaggregate',
+            index=models.Index(fields=['user', 'date'], name='teamdailyaggregate_date_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='teamdailyaggregate',
+            constraint=models.UniqueConstraint(fields=('team', 'date'), name='teamdailyaggregate_unique_day'),
+        ),
+        # aggregate the csv data which has been uploaded so far, the next uploads update only the days they contain
+        migrations.RunSQL(
+            sql="""
+                INSERT INTO csvdata_teamdailyaggregate (user_id, team_id, date, row_count, review_time_sum, merge_time_sum)
+                SELECT csv_row.user_id, csv_row.team_id, csv_row.date, count(*),
+                       sum(csv_row.review_time::bigint), sum(csv_row.merge_time::bigint)
+                FROM csvdata_csvdata csv_row
+                GROUP BY csv_row.user_id, csv_row.team_id, csv_row.date
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
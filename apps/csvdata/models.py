@@ -1,15 +1,95 @@
 from django.db import models
 from django.contrib.auth.models import User
 
+class Team(models.Model):
+    """
+    Team of a user, referenced by the csv data and the visualizations
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    name = models.CharField(max_length=100)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'name'], name='team_unique_name'),
+        ]
+
+    def __str__(self) -> str:
+        return self.name
+
+
 class CSVData(models.Model):
+    """
+    Row of the uploaded csv data. The table is partitioned by date range in PostgreSQL, see partitions.py
+    """
     user        = models.ForeignKey(User, on_delete=models.CASCADE)
     review_time = models.CharField(max_length=100)
-    team        = models.CharField(max_length=100)
+    team        = models.ForeignKey(Team, on_delete=models.CASCADE)
     date        = models.DateField()
     merge_time  = models.CharField(max_length=100)
 
     class Meta:
         verbose_name_plural = 'CSV Data'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'team', 'date', 'review_time', 'merge_time'],
+                name='csvdata_unique_row'
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['user', 'date'], name='csvdata_user_date_idx'),
+        ]
 
     def __str__(self) -> str:
         return f'{self.review_time} - {self.team} - {self.date} - {self.merge_time}'
+
+
+class ArchivedMonth(models.Model):
+    """
+    Month whose partition of the csv data has been archived, the uploads skip its rows so it is not stored again
+    """
+    month       = models.DateField(unique=True)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self) -> str:
+        return self.month.strftime('%Y-%m')
+
+
+class UploadManifest(models.Model):
+    """
+    Record of an uploaded file, used to skip files which have already been ingested
+    """
+    user        = models.ForeignKey(User, on_delete=models.CASCADE)
+    file_hash   = models.CharField(max_length=64)
+    row_count   = models.PositiveIntegerField()
+    uploaded_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'file_hash'], name='uploadmanifest_unique_file'),
+        ]
+
+    def __str__(self) -> str:
+        return f'{self.user} - {self.file_hash}'
+
+
+class TeamDailyAggregate(models.Model):
+    """
+    Row count and sums of the csv data of a team on one day, kept up to date on every upload for the trends
+    """
+    user            = models.ForeignKey(User, on_delete=models.CASCADE)
+    team            = models.ForeignKey(Team, on_delete=models.CASCADE)
+    date            = models.DateField()
+    row_count       = models.PositiveIntegerField()
+    review_time_sum = models.BigIntegerField()
+    merge_time_sum  = models.BigIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['team', 'date'], name='teamdailyaggregate_unique_day'),
+        ]
+        indexes = [
+            models.Index(fields=['user', 'date'], name='teamdailyaggregate_date_idx'),
+        ]
+
+    def __str__(self) -> str:
+        return f'{self.team} - {self.date} - {self.row_count}'
@@ -0,0 +1,236 @@
+import gzip
+import os
+import re
+from datetime import date
+from typing import Optional
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from .models import ArchivedMonth
+
+PARTITIONED_TABLE = 'csvdata_csvdata'
+DEFAULT_PARTITION = 'csvdata_csvdata_default'
+
+PARTITION_BOUND_PATTERN = re.compile(r"FROM \('(\d{4}-\d{2}-\d{2})'\) TO \('(\d{4}-\d{2}-\d{2})'\)")
+
+
+class PartitionManager:
+    """
+    Handler class which contains static methods to manage the monthly partitions of the csv data table.
+
+    Rows outside of the monthly partitions are stored in the default partition. Creating the partition
+    of a month moves the rows of that month out of the default partition, and archiving a partition
+    writes its rows to a compressed csv file, detaches it and drops it.
+    """
+
+    @staticmethod
+    def list_partitions() -> list[tuple[str, date, date]]:
+        """
+        Get the name, the first day and the first day after the range of every monthly partition
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """
+                SELECT child.relname, pg_get_expr(child.relpartbound, child.oid)
+                FROM pg_inherits
+                JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+                JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+                WHERE parent.relname = %s
+                ORDER BY child.relname
+                """,
+                [PARTITIONED_TABLE]
+            )
+            rows = cursor.fetchall()
+
+        partitions = []
+        for name, bound in rows:
+            match = PARTITION_BOUND_PATTERN.search(bound)
+            # the default partition has no range
+            if match is not None:
+                partitions.append((name, date.fromisoformat(match.group(1)), date.fromisoformat(match.group(2))))
+
+        return partitions
+
+    @staticmethod
+    def create_partitions(months_ahead: int, today: Optional[date] = None) -> list[str]:
+        """
+        Create the monthly partitions from the oldest month in the default partition up to months_ahead after today
+        """
+        first_month = month_start(today or date.today())
+
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT min(date) FROM {DEFAULT_PARTITION}')
+            oldest_date = cursor.fetchone()[0]
+
+        if oldest_date is not None:
+            first_month = min(first_month, month_start(oldest_date))
+
+        last_month = add_months(month_start(today or date.today()), months_ahead)
+
+        created = []
+        month = first_month
+        while month <= last_month:
+            if PartitionManager.create_partition(month):
+                created.append(partition_name(month))
+            month = add_months(month, 1)
+
+        return created
+
+    @staticmethod
+    def create_partition(month: date) -> bool:
+        """
+        Create the partition of a month, moving its rows out of the default partition. Returns False if it exists
+        """
+        name = partition_name(month)
+        lower, upper = month.isoformat(), add_months(month, 1).isoformat()
+
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute('SELECT to_regclass(%s)', [name])
+            if cursor.fetchone()[0] is not None:
+                return False
+
+            # the partition is filled before it is attached, because the default partition can't hold rows of its range
+            cursor.execute(f'CREATE TABLE {name} (LIKE {PARTITIONED_TABLE} INCLUDING DEFAULTS)')
+            cursor.execute(
+                f"""
+                WITH moved_rows AS (
+                    DELETE FROM {DEFAULT_PARTITION} WHERE date >= %s AND date < %s RETURNING *
+                )
+                INSERT INTO {name} SELECT * FROM moved_rows
+                """,
+                [lower, upper]
+            )
+            cursor.execute(f"ALTER TABLE {PARTITIONED_TABLE} ATTACH PARTITION {name} FOR VALUES FROM ('{lower}') TO ('{upper}')")
+
+        return True
+
+    @staticmethod
+    def archive_partitions(retention_months: int, archive_root: str, today: Optional[date] = None) -> list[str]:
+        """
+        Archive the partitions which only contain rows older than the retention period
+        """
+        cutoff = retention_cutoff(retention_months, today)
+        if cutoff is None:
+            return []
+
+        return [
+            PartitionManager.archive_partition(name, month, archive_root)
+            for name, month, upper in PartitionManager.list_partitions()
+            if upper <= cutoff
+        ]
+
+    @staticmethod
+    def archive_partition(name: str, month: date, archive_root: str) -> str:
+        """
+        Write the rows of a partition to a gzip compressed csv file, then detach and drop it. Returns the path of the file.
+        An existing archive of the same partition is never replaced, the file of the new run gets a numeric suffix
+        """
+        os.makedirs(archive_root, exist_ok=True)
+        temp_path = os.path.join(archive_root, f'.{name}.{os.getpid()}.csv.gz.tmp')
+        archive_path = None
+
+        try:
+            with transaction.atomic(), connection.cursor() as cursor:
+                # the writes which reach this partition wait for the copy, the reads of the csv data don't.
+                # The rows can't change until the partition is dropped, so the archive is complete
+                cursor.execute(f'LOCK TABLE {name} IN SHARE MODE')
+                cursor.execute(f'SELECT DISTINCT user_id FROM {name}')
+                user_ids = [user_id for user_id, in cursor.fetchall()]
+
+                # the team names are written instead of the ids, so the archive can be read on its own
+                with gzip.open(temp_path, 'wb') as archive_file:
+                    cursor.copy_expert(
+                        f"""
+                        COPY (
+                            SELECT csv_row.user_id, team.name AS team, csv_row.date, csv_row.review_time, csv_row.merge_time
+                            FROM {name} csv_row
+                            JOIN csvdata_team team ON team.id = csv_row.team_id
+                            ORDER BY csv_row.user_id, csv_row.date
+                        ) TO STDOUT WITH (FORMAT csv, HEADER)
+                        """,
+                        archive_file
+                    )
+                archive_path = publish_archive(temp_path, archive_root, name)
+
+                # committed with the drop, from then on the uploads skip the rows of the month
+                ArchivedMonth.objects.get_or_create(month=month)
+
+                # detaching locks the whole csv data table, so it is the last step before the commit
+                cursor.execute(f'ALTER TABLE {PARTITIONED_TABLE} DETACH PARTITION {name}')
+                cursor.execute(f'DROP TABLE {name}')
+        except Exception:
+            # the rows are still in the database, so the files of this run are removed
+            for path in (temp_path, archive_path):
+                if path is not None and os.path.exists(path):
+                    os.unlink(path)
+            raise
+
+        # imported here, so the partition commands don't load pandas unless a partition is archived
+        from .column_store import ColumnStore
+
+        for user_id in user_ids:
+            ColumnStore.invalidate(user_id)
+
+        return archive_path
+
+
+def publish_archive(temp_path: str, archive_root: str, name: str) -> str:
+    """
+    Move a written archive to the first free name among {name}.csv.gz, {name}.1.csv.gz, ... without replacing a file
+    """
+    run = 0
+    while True:
+        archive_path = os.path.join(archive_root, f'{name}.csv.gz' if run == 0 else f'{name}.{run}.csv.gz')
+        try:
+            # unlike a rename, a link fails when the target exists
+            os.link(temp_path, archive_path)
+        except FileExistsError:
+            run += 1
+            continue
+
+        os.unlink(temp_path)
+        return archive_path
+
+
+def retention_cutoff(retention_months: Optional[int] = None, today: Optional[date] = None) -> Optional[date]:
+    """
+    Get the first day which is kept in the database, the partitions of the older months are archived.
+    The retention defaults to CSVDATA_RETENTION_MONTHS, and 0 keeps every row
+    """
+    if retention_months is None:
+        retention_months = settings.CSVDATA_RETENTION_MONTHS
+
+    if retention_months <= 0:
+        return None
+
+    return add_months(month_start(today or date.today()), -retention_months)
+
+
+def archived_months() -> set[date]:
+    """
+    Get the first day of every month which has been archived
+    """
+    return set(ArchivedMonth.objects.values_list('month', flat=True))
+
+
+def partition_name(month: date) -> str:
+    """
+    Get the name of the partition of a month
+    """
+    return f'{PARTITIONED_TABLE}_p{month.year:04d}{month.month:02d}'
+
+
+def month_start(day: date) -> date:
+    """
+    Get the first day of the month of a date
+    """
+    return day.replace(day=1)
+
+
+def add_months(month: date, months: int) -> date:
+    """
+    Get the first day of the month which is a number of months after the month provided
+    """
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
@@ -1,8 +1,22 @@
-from .models import CSVData
+from .models import CSVData, Team
 from rest_framework import serializers
 
 
+class TeamField(serializers.Field):
+    """
+    Team of a csv data row, represented by its name
+    """
+    def to_representation(self, value: Team) -> str:
+        return value.name
+
+    def to_internal_value(self, data: str) -> Team:
+        team, _ = Team.objects.get_or_create(user=self.context['request'].user, name=str(data))
+        return team
+
+
 class CSVDataSerializer(serializers.ModelSerializer):
+    team = TeamField()
+
     class Meta:
         model = CSVData
         fields = ('id', 'review_time', 'team', 'date', 'merge_time')
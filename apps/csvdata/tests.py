@@ -1,5 +1,26 @@
+import gzip
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+from datetime import date
+
+import numpy as np
+import pandas as pd
 from django.contrib.auth.models import User
-from .models import CSVData
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, override_settings
+from analytics_backend.admission import admission_controller
+from .column_store import ColumnStore
+from .models import ArchivedMonth, CSVData, Team, TeamDailyAggregate
+from .partitions import PartitionManager, publish_archive
+from .trends import TrendHandler
+from .utils import StatisticsHandler
 from knox.models import AuthToken
 from rest_framework.test import APIClient
 from rest_framework.test import APITestCase
@@ -43,6 +64,48 @@ class CsvDataTestCase(APITestCase):
 
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
 
+    def test_create_csv_data_gzip_encoded(self):
+        # arrange
+        data = gzip.compress(CsvDataTestCase.DUMMY_CSV_DATA.encode('utf-8'))
+
+        # act
+        response = self.client.post('/api/v1/csvdata/', data=data, content_type='text/csv', HTTP_CONTENT_ENCODING='gzip')
+
+        # assert
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(CSVData.objects.filter(user=self.first_user).count(), 4)
+
+    @override_settings(CSVDATA_UPLOAD_MAX_DECOMPRESSED_SIZE=1024 * 1024)
+    def test_create_csv_data_decompressed_too_large(self):
+        # arrange
+        rows = '\n30,Team A,2023-04-14,10' * 100000
+        data = gzip.compress(('review_time,team,date,merge_time' + rows).encode('utf-8'))
+
+        # act
+        response = self.client.post('/api/v1/csvdata/', data=data, content_type='text/csv', HTTP_CONTENT_ENCODING='gzip')
+
+        # assert
+        self.assertLess(len(data), 64 * 1024)
+        self.assertEqual(response.status_code, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        self.assertFalse(CSVData.objects.filter(user=self.first_user).exists())
+
+    def test_create_csv_data_parquet(self):
+        # arrange
+        data = io.BytesIO()
+        pd.read_csv(io.StringIO(CsvDataTestCase.DUMMY_CSV_DATA)).to_parquet(data)
+
+        # act
+        response = self.client.post('/api/v1/csvdata/', data=data.getvalue(), content_type='application/vnd.apache.parquet')
+
+        # assert
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(CSVData.objects.filter(user=self.first_user).count(), 4)
+
+    def test_create_csv_data_wrong_encoding(self):
+        response = self.client.post('/api/v1/csvdata/', data=CsvDataTestCase.DUMMY_CSV_DATA, content_type='text/csv', HTTP_CONTENT_ENCODING='br')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
     def test_get_uploaded_data(self):
         # arrange
         self.client.post('/api/v1/csvdata/', data=CsvDataTestCase.DUMMY_CSV_DATA, content_type='text')
@@ -54,6 +117,73 @@ class CsvDataTestCase(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(len(response.json()['data']), 4)
 
+    def test_upload_creates_teams(self):
+        # act
+        self.client.post('/api/v1/csvdata/', data=CsvDataTestCase.DUMMY_CSV_DATA, content_type='text')
+        response = self.client.get('/api/v1/csvdata/')
+
+        # assert
+        self.assertEqual(list(Team.objects.filter(user=self.first_user).values_list('name', flat=True).order_by('name')), ['Team A', 'Team B'])
+        self.assertEqual({row['attributes']['team'] for row in response.json()['data']}, {'Team A', 'Team B'})
+
+    def test_create_csv_data_same_file_twice(self):
+        # arrange
+        self.client.post('/api/v1/csvdata/', data=CsvDataTestCase.DUMMY_CSV_DATA, content_type='text')
+
+        # act
+        response = self.client.post('/api/v1/csvdata/', data=CsvDataTestCase.DUMMY_CSV_DATA, content_type='text')
+
+        # assert
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(CSVData.objects.filter(user=self.first_user).count(), 4)
+
+    def test_create_csv_data_larger_than_memory_limit(self):
+        # arrange
+        rows = [f'{index % 97},Team {index % 3},2023-04-{index % 28 + 1:02d},{index % 89}' for index in range(130000)]
+        data = 'review_time,team,date,merge_time\n' + '\n'.join(rows)
+        self.assertGreater(len(data), 2.5 * 1024 * 1024)
+
+        # act
+        response = self.client.post('/api/v1/csvdata/', data=data, content_type='text')
+
+        # assert
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(CSVData.objects.filter(user=self.first_user).exists())
+
+    @override_settings(CSVDATA_UPLOAD_MAX_SIZE=64)
+    def test_create_csv_data_too_large(self):
+        # act
+        response = self.client.post('/api/v1/csvdata/', data=CsvDataTestCase.DUMMY_CSV_DATA, content_type='text')
+
+        # assert
+        self.assertEqual(response.status_code, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        self.assertFalse(CSVData.objects.filter(user=self.first_user).exists())
+
+    def test_create_csv_data_archived_rows(self):
+        # arrange
+        ArchivedMonth.objects.create(month=date(2023, 4, 1))
+        data = CsvDataTestCase.DUMMY_CSV_DATA + '\n40,Team C,2023-05-01,12'
+
+        # act
+        response = self.client.post('/api/v1/csvdata/', data=data, content_type='text')
+
+        # assert
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['archived_rows'], 4)
+        self.assertEqual(list(CSVData.objects.filter(user=self.first_user).values_list('team__name', flat=True)), ['Team C'])
+
+    def test_create_csv_data_overlapping_rows(self):
+        # arrange
+        self.client.post('/api/v1/csvdata/', data=CsvDataTestCase.DUMMY_CSV_DATA, content_type='text')
+        data = CsvDataTestCase.DUMMY_CSV_DATA + '\n40,Team C,2023-04-15,12'
+
+        # act
+        response = self.client.post('/api/v1/csvdata/', data=data, content_type='text')
+
+        # assert
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(CSVData.objects.filter(user=self.first_user).count(), 5)
+
     def test_get_statistics(self):
         # arrange
         self.client.post('/api/v1/csvdata/', data=CsvDataTestCase.DUMMY_CSV_DATA, content_type='text')
@@ -63,3 +193,426 @@ class CsvDataTestCase(APITestCase):
         
         # assert
         self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_get_statistics_date_range(self):
+        # arrange
+        self.client.post('/api/v1/csvdata/', data=CsvDataTestCase.DUMMY_CSV_DATA + '\n40,Team C,2023-04-20,12', content_type='text')
+
+        # act
+        response = self.client.get('/api/v1/csvdata/statistics/?start_date=2023-04-15&end_date=2023-04-30')
+
+        # assert
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(list(response.json().keys()), ['Team C'])
+
+    def test_get_statistics_column_store(self):
+        with tempfile.TemporaryDirectory() as store_root, self.settings(CSVDATA_COLUMN_STORE_ROOT=store_root):
+            # arrange
+            self.client.post('/api/v1/csvdata/', data=CsvDataTestCase.DUMMY_CSV_DATA, content_type='text')
+            self.client.post('/api/v1/csvdata/', data='review_time,team,date,merge_time\n40,Team C,2023-04-15,12', content_type='text')
+
+            # act
+            response = self.client.get('/api/v1/csvdata/statistics/')
+
+            # assert
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(list(response.json().keys()), ['Team A', 'Team B', 'Team C'])
+            self.assertEqual(response.json()['Team A']['review_time']['mean'], 25.0)
+
+            response = self.client.get('/api/v1/csvdata/statistics/?start_date=2023-04-15')
+            self.assertEqual(list(response.json().keys()), ['Team C'])
+
+    def test_column_store_rebuilds_inconsistent_files(self):
+        with tempfile.TemporaryDirectory() as store_root, self.settings(CSVDATA_COLUMN_STORE_ROOT=store_root):
+            # arrange
+            self.client.post('/api/v1/csvdata/', data=CsvDataTestCase.DUMMY_CSV_DATA, content_type='text')
+            date_file = os.path.join(ColumnStore.user_directory(self.first_user.id), 'date.npy')
+            np.save(date_file, np.load(date_file)[:1])
+
+            # act
+            response = self.client.get('/api/v1/csvdata/statistics/')
+
+            # assert
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response.json()['Team A']['review_time']['mean'], 25.0)
+            self.assertEqual(len(ColumnStore.load(self.first_user.id)['date']), 4)
+
+    def test_get_trends(self):
+        # arrange
+        self.client.post('/api/v1/csvdata/', data=CsvDataTestCase.DUMMY_CSV_DATA, content_type='text')
+        self.client.post('/api/v1/csvdata/', data='review_time,team,date,merge_time\n10,Team A,2023-04-20,4\n50,Team A,2023-04-14,6', content_type='text')
+
+        # act
+        response = self.client.get('/api/v1/csvdata/trends/?team=Team+A')
+
+        # assert
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['end_date'], '2023-04-20')
+        self.assertEqual(list(response.json()['teams'].keys()), ['Team A'])
+        self.assertEqual(response.json()['teams']['Team A']['review_time']['7d'],
+                         {'mean': 27.5, 'median': 25.0, 'mean_delta': None, 'median_delta': None})
+
+    def test_daily_aggregates_updated_incrementally(self):
+        # arrange
+        self.client.post('/api/v1/csvdata/', data=CsvDataTestCase.DUMMY_CSV_DATA, content_type='text')
+        team_a = Team.objects.get(user=self.first_user, name='Team A')
+        team_b = Team.objects.get(user=self.first_user, name='Team B')
+
+        # act
+        self.client.post('/api/v1/csvdata/', data='review_time,team,date,merge_time\n40,Team A,2023-04-14,9', content_type='text')
+
+        # assert
+        aggregate = TeamDailyAggregate.objects.get(team=team_a, date='2023-04-14')
+        self.assertEqual((aggregate.row_count, aggregate.review_time_sum), (3, 90))
+        self.assertEqual(TeamDailyAggregate.objects.get(team=team_b, date='2023-04-14').row_count, 2)
+
+    def test_update_csv_data_moves_daily_aggregate(self):
+        # arrange
+        self.client.post('/api/v1/csvdata/', data='review_time,team,date,merge_time\n30,Team A,2023-04-14,10', content_type='text')
+        row = CSVData.objects.get(user=self.first_user)
+
+        # act
+        response = self.client.patch(f'/api/v1/csvdata/{row.id}/', data=json.dumps({'date': '2023-04-16'}),
+                                     content_type='application/json')
+
+        # assert
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(list(TeamDailyAggregate.objects.values_list('date', flat=True)), [date(2023, 4, 16)])
+
+    def test_get_trends_no_data(self):
+        # act
+        response = self.client.get('/api/v1/csvdata/trends/')
+
+        # assert
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class StatisticsHandlerTestCase(SimpleTestCase):
+    """
+    Test suite for the statistics calculation
+    """
+    DUMMY_DATA_FRAME = pd.DataFrame({
+        'review_time': [30, 25, 20, 15, 20, 40],
+        'merge_time': [10, 8, 7, 5, 7, 9],
+        'team': ['Team A', 'Team B', 'Team A', 'Team B', 'Team C', 'Team A']
+    })
+
+    def test_calculate_team_stats(self):
+        # act
+        team_stats = StatisticsHandler.calculate_team_stats(StatisticsHandlerTestCase.DUMMY_DATA_FRAME)
+
+        # assert
+        self.assertEqual(list(team_stats.keys()), ['Team A', 'Team B', 'Team C'])
+        self.assertEqual(team_stats['Team A']['review_time'], {'mean': 30.0, 'median': 30.0, 'mode': 20})
+        self.assertEqual(team_stats['Team B']['merge_time'], {'mean': 6.5, 'median': 6.5, 'mode': 5})
+
+    @override_settings(STATISTICS_PARALLEL_MIN_ROWS=0, STATISTICS_MAX_WORKERS=2)
+    def test_calculate_team_stats_parallel(self):
+        # act
+        team_stats = StatisticsHandler.calculate_team_stats(StatisticsHandlerTestCase.DUMMY_DATA_FRAME)
+
+        # assert
+        with override_settings(STATISTICS_PARALLEL_MIN_ROWS=1000):
+            self.assertEqual(team_stats, StatisticsHandler.calculate_team_stats(StatisticsHandlerTestCase.DUMMY_DATA_FRAME))
+
+    @override_settings(STATISTICS_PARALLEL_MIN_ROWS=0, STATISTICS_MAX_WORKERS=2)
+    def test_calculate_team_stats_broken_pool(self):
+        # arrange
+        executor = StatisticsHandler.get_executor()
+        executor.submit(os.getpid).result()
+        for process in list(executor._processes.values()):
+            process.kill()
+            process.join()
+
+        # act
+        team_stats = StatisticsHandler.calculate_team_stats(StatisticsHandlerTestCase.DUMMY_DATA_FRAME)
+
+        # assert
+        self.assertEqual(team_stats['Team A']['review_time'], {'mean': 30.0, 'median': 30.0, 'mode': 20})
+        self.assertIsNot(StatisticsHandler.get_executor(), executor)
+
+
+class TrendHandlerTestCase(SimpleTestCase):
+    """
+    Test suite for the rolling trends calculation
+    """
+    DUMMY_AGGREGATES = pd.DataFrame({
+        'team': ['Team A', 'Team A', 'Team B', 'Team A'],
+        'date': [date(2023, 1, 1), date(2023, 1, 8), date(2023, 1, 8), date(2023, 1, 10)],
+        'row_count': [2, 1, 1, 1],
+        'review_time_sum': [20, 30, 5, 40],
+        'merge_time_sum': [2, 3, 4, 5],
+    })
+    # the rows of the aggregates
+    DUMMY_COLUMNS = {
+        'date': np.array(['2023-01-01', '2023-01-01', '2023-01-08', '2023-01-08', '2023-01-10'], dtype='datetime64[D]'),
+        'team_codes': np.array([0, 0, 0, 1, 0], dtype=np.int32),
+        'teams': np.array(['Team A', 'Team B']),
+        'team_ids': np.array([1, 2], dtype=np.int64),
+        'review_time': np.array([10, 10, 30, 5, 40], dtype=np.int64),
+        'merge_time': np.array([1, 1, 3, 4, 5], dtype=np.int64),
+    }
+
+    def test_calculate_rolling_trends(self):
+        # act
+        trends = TrendHandler.calculate_rolling_trends(TrendHandlerTestCase.DUMMY_AGGREGATES,
+                                                       TrendHandlerTestCase.DUMMY_COLUMNS, date(2023, 1, 10))
+
+        # assert
+        self.assertEqual(list(trends.keys()), ['Team A', 'Team B'])
+        self.assertEqual(trends['Team A']['review_time']['7d'],
+                         {'mean': 35.0, 'median': 35.0, 'mean_delta': 25.0, 'median_delta': 25.0})
+        self.assertEqual(trends['Team A']['review_time']['30d'],
+                         {'mean': 22.5, 'median': 20.0, 'mean_delta': None, 'median_delta': None})
+        self.assertEqual(trends['Team B']['merge_time']['90d'],
+                         {'mean': 4.0, 'median': 4.0, 'mean_delta': None, 'median_delta': None})
+
+
+class ArchiveFileTestCase(SimpleTestCase):
+    """
+    Test suite for the archive files of the partitions
+    """
+
+    def test_publish_archive_keeps_existing_archive(self):
+        with tempfile.TemporaryDirectory() as archive_root:
+            # arrange
+            paths = []
+            for content in (b'first run', b'second run'):
+                temp_path = os.path.join(archive_root, 'archive.tmp')
+                with open(temp_path, 'wb') as temp_file:
+                    temp_file.write(content)
+
+                # act
+                paths.append(publish_archive(temp_path, archive_root, 'csvdata_csvdata_p202304'))
+
+            # assert
+            self.assertEqual([os.path.basename(path) for path in paths],
+                             ['csvdata_csvdata_p202304.csv.gz', 'csvdata_csvdata_p202304.1.csv.gz'])
+            with open(paths[0], 'rb') as archive_file:
+                self.assertEqual(archive_file.read(), b'first run')
+            self.assertEqual(sorted(os.listdir(archive_root)), sorted(os.path.basename(path) for path in paths))
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', 'The csv data is only partitioned in PostgreSQL')
+class PartitionTestCase(APITestCase):
+    """
+    Test suite for the partitions of the csv data
+    """
+
+    def setUp(self):
+        """Set up the test suite"""
+        self.user = User.objects.create_user(
+            username="testuser1",
+            password="test_password1"
+        )
+
+        _, self.token = AuthToken.objects.create(self.user)
+
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token)
+        self.client.post('/api/v1/csvdata/', data=CsvDataTestCase.DUMMY_CSV_DATA, content_type='text')
+
+    def test_create_partitions(self):
+        # act
+        call_command('create_csvdata_partitions', months_ahead=1)
+
+        # assert
+        partitions = [name for name, _, _ in PartitionManager.list_partitions()]
+        self.assertIn('csvdata_csvdata_p202304', partitions)
+        self.assertEqual(CSVData.objects.filter(user=self.user).count(), 4)
+
+    def test_archive_partitions(self):
+        # arrange
+        call_command('create_csvdata_partitions', months_ahead=0)
+
+        with tempfile.TemporaryDirectory() as archive_root:
+            # act
+            call_command('archive_csvdata_partitions', retention_months=1, archive_dir=archive_root)
+
+            # assert
+            with gzip.open(os.path.join(archive_root, 'csvdata_csvdata_p202304.csv.gz'), 'rt') as archive_file:
+                archived_rows = pd.read_csv(archive_file)
+            self.assertEqual(len(archived_rows), 4)
+            self.assertEqual(CSVData.objects.filter(user=self.user).count(), 0)
+            self.assertTrue(ArchivedMonth.objects.filter(month=date(2023, 4, 1)).exists())
+
+
+@override_settings(ADMISSION_MAX_CONCURRENT=2, ADMISSION_MAX_CONCURRENT_PER_USER=1,
+                   ADMISSION_MAX_QUEUE=1, ADMISSION_QUEUE_TIMEOUT=0.1, ADMISSION_RETRY_AFTER=7)
+class AdmissionControlTestCase(APITestCase):
+    """
+    Test suite for the admission control of the heavy endpoints
+    """
+
+    def setUp(self):
+        """Set up the test suite"""
+        self.user = User.objects.create_user(
+            username="testuser1",
+            password="test_password1"
+        )
+
+        _, self.token = AuthToken.objects.create(self.user)
+
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token)
+
+        admission_controller.reset()
+
+    def start_request(self, target, release_user_id=None):
+        """Run a request in a thread, which releases its slot and closes its database connection at the end"""
+        def run():
+            try:
+                target()
+            finally:
+                if release_user_id is not None:
+                    admission_controller.release(release_user_id)
+                connection.close()
+
+        thread = threading.Thread(target=run)
+        thread.start()
+        return thread
+
+    def hold_slot(self, user_id):
+        """Hold a slot of the user in another request thread until the returned function is called"""
+        is_acquired = threading.Event()
+        is_done = threading.Event()
+
+        def hold():
+            admission_controller.acquire(user_id)
+            is_acquired.set()
+            is_done.wait()
+
+        thread = self.start_request(hold, release_user_id=user_id)
+        is_acquired.wait()
+
+        def stop():
+            is_done.set()
+            thread.join()
+
+        return stop
+
+    def test_statistics_rejected_when_user_is_saturated(self):
+        # arrange
+        stop_holding = self.hold_slot(self.user.id)
+
+        # act
+        try:
+            response = self.client.get('/api/v1/csvdata/statistics/')
+        finally:
+            stop_holding()
+
+        # assert
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(response['Retry-After'], '7')
+        self.assertEqual(admission_controller.get_stats()['rejected_timeout'], 1)
+
+    def test_rejected_when_queue_is_full(self):
+        # arrange
+        other_user_id = self.user.id + 1
+        stop_holding = [self.hold_slot(self.user.id), self.hold_slot(other_user_id)]
+        waiting_request = self.start_request(lambda: admission_controller.acquire(self.user.id))
+        while admission_controller.get_stats()['queue_depth'] == 0:
+            time.sleep(0.001)
+
+        # act
+        rejection = admission_controller.acquire(other_user_id + 1)
+        waiting_request.join()
+        for stop in stop_holding:
+            stop()
+
+        # assert
+        self.assertEqual(rejection, 'queue_full')
+        self.assertEqual(admission_controller.get_stats()['rejected_queue_full'], 1)
+
+    @override_settings(ADMISSION_QUEUE_TIMEOUT=5)
+    def test_waiting_request_admitted_after_release(self):
+        # arrange
+        stop_holding = self.hold_slot(self.user.id)
+        results = []
+        waiting_request = self.start_request(lambda: results.append(admission_controller.acquire(self.user.id)),
+                                             release_user_id=self.user.id)
+        while admission_controller.get_stats()['queue_depth'] == 0:
+            time.sleep(0.001)
+
+        # act
+        stop_holding()
+        waiting_request.join()
+
+        # assert
+        self.assertEqual(results, [None])
+        self.assertEqual(admission_controller.get_stats()['queued'], 1)
+        self.assertEqual(admission_controller.get_stats()['running'], 0)
+
+    @unittest.skipUnless(connection.vendor == 'postgresql', 'The slots are only shared through PostgreSQL')
+    def test_slots_shared_between_connections(self):
+        # arrange
+        stop_holding = self.hold_slot(self.user.id)
+
+        # act
+        rejection = admission_controller.acquire(self.user.id)
+        running = admission_controller.get_stats()['running']
+        stop_holding()
+
+        # assert
+        self.assertEqual(rejection, 'timeout')
+        self.assertEqual(running, 1)
+
+    @unittest.skipUnless(connection.vendor == 'postgresql', 'The slots are only shared through PostgreSQL')
+    def test_slots_not_taken_twice_by_one_connection(self):
+        # act
+        first_rejection = admission_controller.acquire(self.user.id)
+        second_rejection = admission_controller.acquire(self.user.id)
+        admission_controller.release(self.user.id)
+        admission_controller.release(self.user.id)
+
+        # assert
+        self.assertEqual((first_rejection, second_rejection), (None, 'timeout'))
+        self.assertEqual(admission_controller.get_stats()['running'], 0)
+
+    def test_trends_rejected_when_user_is_saturated(self):
+        # arrange
+        stop_holding = self.hold_slot(self.user.id)
+
+        # act
+        try:
+            response = self.client.get('/api/v1/csvdata/trends/')
+        finally:
+            stop_holding()
+
+        # assert
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+    def test_admission_stats(self):
+        # arrange
+        self.client.get('/api/v1/csvdata/statistics/')
+        self.user.is_staff = True
+        self.user.save()
+
+        # act
+        response = self.client.get('/api/v1/admission/')
+
+        # assert
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['admitted'], 1)
+        self.assertEqual(response.json()['queue_depth'], 0)
+
+    @override_settings(ADMISSION_CACHE_ALIAS='default')
+    def test_admission_counters_in_shared_cache(self):
+        # arrange
+        caches['default'].clear()
+        admission_controller.acquire(self.user.id)
+        admission_controller.release(self.user.id)
+
+        # act
+        stats = admission_controller.get_stats()
+
+        # assert
+        self.assertEqual(stats['admitted'], 1)
+        self.assertEqual(caches['default'].get('admission:admitted'), 1)
+
+    def test_admission_stats_only_for_staff(self):
+        # act
+        response = self.client.get('/api/v1/admission/')
+
+        # assert
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
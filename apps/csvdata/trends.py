@@ -0,0 +1,178 @@
+from datetime import date, timedelta
+from typing import Any, Iterable, Optional
+
+import numpy as np
+import pandas as pd
+from django.contrib.auth.models import User
+from django.db import connection
+from django.db.models import Max, Q
+
+from .column_store import Columns, ColumnStore
+from .models import CSVData, TeamDailyAggregate
+
+# lengths in days of the rolling windows
+TREND_WINDOWS = (7, 30, 90)
+TREND_COLUMNS = ('review_time', 'merge_time')
+AGGREGATE_COLUMNS = ('row_count', 'review_time_sum', 'merge_time_sum')
+# number of aggregates written with one query
+AGGREGATE_BATCH_SIZE = 5000
+# first key of the advisory lock which serializes the aggregate updates of a user
+AGGREGATE_LOCK_CLASS = 0x74726400
+
+Trends = dict[str, dict[str, dict[str, dict[str, Optional[float]]]]]
+
+
+class TrendHandler:
+    """
+    Handler class which contains static methods to maintain the daily aggregates of the csv data and to calculate the trends.
+
+    Every team has one TeamDailyAggregate per day with rows. An upload recalculates only the days it
+    contains, so its cost doesn't grow with the history. The trends are calculated from the aggregates
+    of the last 2 * max(TREND_WINDOWS) days, pivoted to a matrix with a row per day and a column per
+    team and value, so every window is one rolling pass over all the teams. The rolling mean is
+    weighted by the row count of the days. A median can't be combined from daily values, so the
+    medians are calculated from the rows of the same days, read from the column store.
+    """
+
+    @staticmethod
+    def update_daily_aggregates(user: User, team_days: Iterable[tuple[int, Any]]) -> None:
+        """
+        Recalculate the aggregates of the (team id, date) pairs from their rows, removing those which have no rows left.
+        Must run in the transaction which changed the rows, so the lock is held until they are committed
+        """
+        team_days = {(int(team_id), pd.Timestamp(day).date()) for team_id, day in team_days}
+        if not team_days:
+            return
+
+        if connection.vendor == 'postgresql':
+            # the concurrent uploads of a user wait here, so each one reads the rows the previous ones committed
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT pg_advisory_xact_lock(%s, %s)', [AGGREGATE_LOCK_CLASS, user.id])
+
+        dates = [day for _, day in team_days]
+        rows = CSVData.objects.filter(
+            user=user,
+            team_id__in={team_id for team_id, _ in team_days},
+            date__range=(min(dates), max(dates))
+        ).values_list('team_id', 'date', 'review_time', 'merge_time')
+        df = pd.DataFrame(list(rows), columns=['team_id', 'date', 'review_time', 'merge_time'])
+        df = df.astype({'review_time': np.int64, 'merge_time': np.int64})
+
+        # the date range also contains days of the teams which have not been changed
+        df = df[pd.MultiIndex.from_arrays([df['team_id'], df['date']]).isin(list(team_days))]
+
+        daily = df.groupby(['team_id', 'date']).agg(
+            row_count=('review_time', 'size'),
+            review_time_sum=('review_time', 'sum'),
+            merge_time_sum=('merge_time', 'sum'),
+        )
+
+        aggregates = [
+            TeamDailyAggregate(
+                user=user,
+                team_id=int(team_id),
+                date=day,
+                row_count=int(row.row_count),
+                review_time_sum=int(row.review_time_sum),
+                merge_time_sum=int(row.merge_time_sum),
+            )
+            for (team_id, day), row in zip(daily.index, daily.itertuples(index=False))
+        ]
+        TeamDailyAggregate.objects.bulk_create(aggregates, batch_size=AGGREGATE_BATCH_SIZE, update_conflicts=True,
+                                               unique_fields=['team', 'date'], update_fields=list(AGGREGATE_COLUMNS))
+
+        empty_days = team_days - {(int(team_id), day) for team_id, day in daily.index}
+        if empty_days:
+            query = Q()
+            for team_id, day in empty_days:
+                query |= Q(team_id=team_id, date=day)
+            TeamDailyAggregate.objects.filter(query, user=user).delete()
+
+    @staticmethod
+    def load_daily_aggregates(user: User, end_date: Optional[date] = None,
+                              team: Optional[str] = None) -> tuple[pd.DataFrame, Optional[date]]:
+        """
+        Get the aggregates which the trends ending on end_date need, sorted by date. end_date defaults to the last day with data
+        """
+        aggregates = TeamDailyAggregate.objects.filter(user=user)
+        if team is not None:
+            aggregates = aggregates.filter(team__name=team)
+
+        if end_date is None:
+            end_date = aggregates.aggregate(Max('date'))['date__max']
+
+        columns = ['team', 'date', *AGGREGATE_COLUMNS]
+        if end_date is None:
+            return pd.DataFrame(columns=columns), None
+
+        start_date = end_date - timedelta(days=2 * max(TREND_WINDOWS) - 1)
+        rows = aggregates.filter(date__range=(start_date, end_date)).order_by('date', 'team__name') \
+            .values_list('team__name', 'date', *AGGREGATE_COLUMNS)
+
+        return pd.DataFrame(list(rows), columns=columns), end_date
+
+    @staticmethod
+    def load_trend_columns(user: User, end_date: date, team: Optional[str] = None) -> Columns:
+        """
+        Get the rows which the medians of the trends ending on end_date need
+        """
+        start_date = end_date - timedelta(days=2 * max(TREND_WINDOWS) - 1)
+        columns = ColumnStore.load_columns(user, start_date, end_date)
+        if team is not None:
+            columns = ColumnStore.filter_team(columns, team)
+
+        return columns
+
+    @staticmethod
+    def calculate_rolling_trends(df: pd.DataFrame, columns: Columns, end_date: date) -> Trends:
+        """
+        Calculate the rolling mean and median of every window ending on end_date, and their change since the previous window
+        """
+        days = pd.date_range(end=pd.Timestamp(end_date), periods=2 * max(TREND_WINDOWS), freq='D')
+        df = df.assign(date=pd.to_datetime(df['date']))
+
+        # a row per day, also for the days without data, so a window of n days is n rows
+        matrix = df.pivot(index='date', columns='team', values=list(AGGREGATE_COLUMNS)).reindex(days)
+        totals = matrix.astype(float).fillna(0)
+
+        # the age in days of every row, the window of n days ending on end_date holds the ages 0 to n - 1
+        rows = ColumnStore.to_data_frame(columns)
+        ages = (np.datetime64(end_date, 'D') - columns['date']).astype(np.int64)
+
+        teams = list(matrix['row_count'].columns)
+        trends: Trends = {team: {column: {} for column in TREND_COLUMNS} for team in teams}
+
+        for window in TREND_WINDOWS:
+            rolling_totals = totals.rolling(window, min_periods=1).sum()
+            current_rows = rows[ages < window].groupby('team', observed=True)
+            previous_rows = rows[(ages >= window) & (ages < 2 * window)].groupby('team', observed=True)
+
+            for column in TREND_COLUMNS:
+                # the days without rows give 0 / 0, so the windows without rows have no mean
+                means = rolling_totals[f'{column}_sum'] / rolling_totals['row_count']
+
+                # the last row is the window ending on end_date, and the row window days before is the previous window
+                current_means, previous_means = means.iloc[-1], means.iloc[-1 - window]
+                mean_deltas = current_means - previous_means
+
+                # the teams without rows in a window are missing, so they have no median
+                current_medians = current_rows[column].median().reindex(teams)
+                previous_medians = previous_rows[column].median().reindex(teams)
+                median_deltas = current_medians - previous_medians
+
+                for team in teams:
+                    trends[team][column][f'{window}d'] = {
+                        'mean': to_optional_float(current_means[team]),
+                        'median': to_optional_float(current_medians[team]),
+                        'mean_delta': to_optional_float(mean_deltas[team]),
+                        'median_delta': to_optional_float(median_deltas[team]),
+                    }
+
+        return trends
+
+
+def to_optional_float(value: float) -> Optional[float]:
+    """
+    Convert a value to a float for the JSON response, where a missing value is None
+    """
+    return None if pd.isna(value) else float(value)
@@ -0,0 +1,368 @@
+import gzip
+import hashlib
+import io
+import multiprocessing
+import os
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import date
+from multiprocessing import shared_memory
+from typing import BinaryIO, Optional, Union
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+
+# columns which an upload is allowed to contain
+CSV_COLUMNS = ('review_time', 'team', 'date', 'merge_time')
+
+PARQUET_CONTENT_TYPES = ('application/vnd.apache.parquet', 'application/x-parquet')
+ARROW_STREAM_CONTENT_TYPES = ('application/vnd.apache.arrow.stream',)
+ARROW_FILE_CONTENT_TYPES = ('application/vnd.apache.arrow.file',)
+
+# size of the chunks in which the upload is read from the request
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+# uploads larger than this are written to a temporary file instead of being kept in memory
+UPLOAD_SPOOL_SIZE = 16 * 1024 * 1024
+
+# columns which are copied in shared memory for the statistics workers
+STATISTICS_COLUMNS = ('review_time', 'merge_time')
+
+TeamStats = dict[str, dict[str, dict[str, Union[float, int]]]]
+
+
+class UploadTooLarge(Exception):
+    """
+    Raised when an upload is larger than CSVDATA_UPLOAD_MAX_SIZE, or decompresses to more than CSVDATA_UPLOAD_MAX_DECOMPRESSED_SIZE
+    """
+
+
+class SizeLimitedReader(io.RawIOBase):
+    """
+    Reader which counts the bytes read from a stream and raises UploadTooLarge past a maximum
+    """
+
+    def __init__(self, stream: BinaryIO, max_size: int) -> None:
+        super().__init__()
+        self._stream = stream
+        self._max_size = max_size
+        self._size = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        data = self._stream.read(len(buffer))
+
+        self._size += len(data)
+        if self._size > self._max_size:
+            raise UploadTooLarge(f"The decompressed upload is larger than the maximum of {self._max_size} bytes")
+
+        buffer[:len(data)] = data
+        return len(data)
+
+
+class UploadDecoder:
+    """
+    Handler class which contains static methods to read uploaded data in a data frame
+    """
+
+    @staticmethod
+    def spool_body(stream: Optional[BinaryIO], max_size: int) -> tuple[BinaryIO, str]:
+        """
+        Copy the request body in chunks and hash it on the way. Bodies larger than UPLOAD_SPOOL_SIZE are moved
+        to a temporary file, so a large upload is never held whole in memory. Returns the copy and the sha256 hash
+        """
+        body_file: BinaryIO = io.BytesIO()
+        file_hash = hashlib.sha256()
+        size = 0
+
+        while stream is not None:
+            chunk = stream.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+
+            size += len(chunk)
+            if size > max_size:
+                body_file.close()
+                raise UploadTooLarge(f"The upload is larger than the maximum of {max_size} bytes")
+
+            if size > UPLOAD_SPOOL_SIZE and isinstance(body_file, io.BytesIO):
+                temp_file = tempfile.TemporaryFile()
+                temp_file.write(body_file.getbuffer())
+                body_file.close()
+                body_file = temp_file
+
+            file_hash.update(chunk)
+            body_file.write(chunk)
+
+        body_file.seek(0)
+
+        return body_file, file_hash.hexdigest()
+
+    @staticmethod
+    def read_data_frame(body_file: BinaryIO, content_type: str, content_encoding: Optional[str]) -> pd.DataFrame:
+        """
+        Read the uploaded body based on its content type and content encoding, and validate its columns
+        """
+        stream = UploadDecoder.decompress(body_file, content_encoding)
+        media_type = content_type.split(';')[0].strip().lower()
+
+        if media_type in PARQUET_CONTENT_TYPES:
+            df = UploadDecoder.read_parquet(stream)
+        elif media_type in ARROW_STREAM_CONTENT_TYPES + ARROW_FILE_CONTENT_TYPES:
+            df = UploadDecoder.read_arrow(stream, media_type in ARROW_FILE_CONTENT_TYPES)
+        else:
+            df = pd.read_csv(io.TextIOWrapper(stream, encoding='utf-8'))
+
+        UploadDecoder.validate(df)
+
+        return df
+
+    @staticmethod
+    def decompress(stream: BinaryIO, content_encoding: Optional[str]) -> BinaryIO:
+        """
+        Wrap the stream in a streaming decompressor for the content encoding. The decompressed stream is limited
+        to CSVDATA_UPLOAD_MAX_DECOMPRESSED_SIZE bytes, because a small compressed body can expand a thousandfold
+        """
+        encoding = (content_encoding or 'identity').strip().lower()
+
+        if encoding == 'identity':
+            return stream
+        elif encoding == 'gzip':
+            decompressed = gzip.GzipFile(fileobj=stream)
+        elif encoding == 'zstd':
+            import zstandard
+            decompressed = zstandard.ZstdDecompressor().stream_reader(stream)
+        else:
+            raise Exception(f"Unsupported content encoding: {content_encoding}")
+
+        return io.BufferedReader(SizeLimitedReader(decompressed, settings.CSVDATA_UPLOAD_MAX_DECOMPRESSED_SIZE),
+                                 buffer_size=UPLOAD_CHUNK_SIZE)
+
+    @staticmethod
+    def read_parquet(stream: BinaryIO) -> pd.DataFrame:
+        """
+        Read a parquet file column-wise. Parquet needs random access, so a decompressed stream is read in memory
+        """
+        import pyarrow.parquet as pq
+
+        if not stream.seekable():
+            stream = io.BytesIO(stream.read())
+
+        return pq.read_table(stream).to_pandas()
+
+    @staticmethod
+    def read_arrow(stream: BinaryIO, is_file_format: bool) -> pd.DataFrame:
+        """
+        Read an Arrow IPC body, either in the streaming format or in the random access file format
+        """
+        import pyarrow as pa
+
+        if is_file_format:
+            if not stream.seekable():
+                stream = io.BytesIO(stream.read())
+            reader = pa.ipc.open_file(stream)
+        else:
+            reader = pa.ipc.open_stream(stream)
+
+        return reader.read_all().to_pandas()
+
+    @staticmethod
+    def drop_archived_rows(df: pd.DataFrame, months: set[date]) -> tuple[pd.DataFrame, int]:
+        """
+        Drop the rows of the archived months (given by their first day), so they are not stored again. Returns the rows
+        kept and the number of rows dropped
+        """
+        if not months:
+            return df, 0
+
+        is_archived = pd.to_datetime(df['date']).dt.to_period('M').dt.start_time.dt.date.isin(months)
+
+        return df[~is_archived], int(is_archived.sum())
+
+    @staticmethod
+    def validate(df: pd.DataFrame) -> None:
+        """
+        Check that the uploaded data has rows and only contains the expected columns
+        """
+        if df.empty or any(column not in CSV_COLUMNS for column in df.columns):
+            raise Exception("The CSV data does not have correct format")
+
+
+class StatisticsHandler:
+    """
+    Handler class which contains static methods to calculate the statistics per team.
+
+    The rows are sorted by team so that every team is a contiguous slice of the value arrays.
+    Small inputs are processed in the current process, while large inputs are split in chunks
+    of teams which are processed in a process pool. The value arrays are placed in shared memory,
+    so the workers only receive the name of the memory block and the slice bounds of their teams.
+    """
+
+    _executor: Optional[ProcessPoolExecutor] = None
+    _executor_lock = threading.Lock()
+
+    @staticmethod
+    def calculate_team_stats(df: pd.DataFrame) -> TeamStats:
+        """
+        Calculate statistics for each team in the data frame
+        """
+        codes, team_names = pd.factorize(df['team'], sort=True)
+
+        return StatisticsHandler.calculate_team_stats_from_codes(
+            np.asarray(team_names),
+            codes,
+            df['review_time'].to_numpy(dtype=np.int64),
+            df['merge_time'].to_numpy(dtype=np.int64)
+        )
+
+    @staticmethod
+    def calculate_team_stats_from_codes(team_names: np.ndarray, team_codes: np.ndarray,
+                                        review_time: np.ndarray, merge_time: np.ndarray) -> TeamStats:
+        """
+        Calculate statistics for each team, where team_codes holds the index in team_names for every row
+        """
+        order = np.argsort(team_codes, kind='stable')
+        counts = np.bincount(team_codes, minlength=len(team_names))
+        ends = np.cumsum(counts)
+        starts = ends - counts
+
+        # keep only the teams which have rows, in the order of their names
+        bounds = [(int(code), int(starts[code]), int(ends[code])) for code in np.flatnonzero(counts)]
+
+        values = np.stack([review_time[order], merge_time[order]]).astype(np.int64, copy=False)
+
+        if len(order) < settings.STATISTICS_PARALLEL_MIN_ROWS or StatisticsHandler.max_workers() < 2:
+            results = calculate_partition_stats(values, bounds)
+        else:
+            try:
+                results = StatisticsHandler.calculate_parallel(values, bounds)
+            except BrokenProcessPool:
+                # a worker of the pool has died (e.g. killed for memory), so the next request gets a new pool
+                StatisticsHandler.reset_executor()
+                results = calculate_partition_stats(values, bounds)
+
+        return {str(team_names[code]): stats for code, stats in results}
+
+    @staticmethod
+    def calculate_parallel(values: np.ndarray, bounds: list[tuple[int, int, int]]) -> list[tuple[int, dict]]:
+        """
+        Calculate the statistics for the team slices in a process pool, using shared memory for the values
+        """
+        executor = StatisticsHandler.get_executor()
+        chunks = np.array_split(np.arange(len(bounds)), StatisticsHandler.max_workers() * 4)
+
+        block = shared_memory.SharedMemory(create=True, size=values.nbytes)
+        try:
+            shared_values = np.ndarray(values.shape, dtype=values.dtype, buffer=block.buf)
+            shared_values[:] = values
+
+            futures = [
+                executor.submit(calculate_shared_partition_stats, block.name, values.shape,
+                                [bounds[index] for index in chunk])
+                for chunk in chunks if len(chunk) > 0
+            ]
+
+            results = []
+            for future in futures:
+                results.extend(future.result())
+
+            del shared_values
+        finally:
+            block.close()
+            block.unlink()
+
+        return results
+
+    @staticmethod
+    def max_workers() -> int:
+        """
+        Number of processes used for the statistics calculation
+        """
+        return settings.STATISTICS_MAX_WORKERS or os.cpu_count() or 1
+
+    @staticmethod
+    def get_executor() -> ProcessPoolExecutor:
+        """
+        Get the process pool, creating it on first use
+        """
+        with StatisticsHandler._executor_lock:
+            if StatisticsHandler._executor is None:
+                # spawn the workers so that they don't inherit the threads and connections of the server
+                StatisticsHandler._executor = ProcessPoolExecutor(
+                    max_workers=StatisticsHandler.max_workers(),
+                    mp_context=multiprocessing.get_context('spawn')
+                )
+
+            return StatisticsHandler._executor
+
+    @staticmethod
+    def reset_executor() -> None:
+        """
+        Drop the process pool, so the next parallel calculation creates a new one
+        """
+        with StatisticsHandler._executor_lock:
+            executor, StatisticsHandler._executor = StatisticsHandler._executor, None
+
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+def calculate_shared_partition_stats(block_name: str, shape: tuple[int, int],
+                                     bounds: list[tuple[int, int, int]]) -> list[tuple[int, dict]]:
+    """
+    Worker function which attaches to the shared memory block and calculates the statistics for its teams
+    """
+    block = shared_memory.SharedMemory(name=block_name)
+    try:
+        values = np.ndarray(shape, dtype=np.int64, buffer=block.buf)
+        results = calculate_partition_stats(values, bounds)
+        del values
+    finally:
+        block.close()
+
+    return results
+
+
+def calculate_partition_stats(values: np.ndarray, bounds: list[tuple[int, int, int]]) -> list[tuple[int, dict]]:
+    """
+    Calculate the statistics for the team slices of the sorted value arrays
+    """
+    results = []
+    for code, start, end in bounds:
+        results.append((code, {
+            column: calculate_single_statistics(values[index, start:end])
+            for index, column in enumerate(STATISTICS_COLUMNS)
+        }))
+
+    return results
+
+
+def calculate_single_statistics(column: np.ndarray) -> dict[str, Union[float, int]]:
+    """
+    Calculate mean, median and mode for one column of a team
+    """
+    unique_values, counts = np.unique(column, return_counts=True)
+
+    return {
+        'mean': float(np.mean(column)),
+        'median': float(np.median(column)),
+        # the smallest of the most frequent values, like pandas mode
+        'mode': int(unique_values[np.argmax(counts)])
+    }
+
+
+def parse_date_range(query_params: dict[str, str]) -> tuple[Optional[date], Optional[date]]:
+    """
+    Get the start_date and end_date query parameters (YYYY-MM-DD), which are both optional
+    """
+    start_date = query_params.get('start_date')
+    end_date = query_params.get('end_date')
+
+    return (
+        date.fromisoformat(start_date) if start_date else None,
+        date.fromisoformat(end_date) if end_date else None
+    )
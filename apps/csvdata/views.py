@@ -1,23 +1,29 @@
 import asyncio
 import traceback
-from io import StringIO
-from typing import Any, Any, Union
-import csv
+from typing import Any
 
-import numpy as np
-import pandas as pd
 from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
 from django.http import JsonResponse, HttpRequest
 from rest_framework import status, viewsets
 from rest_framework.mixins import (ListModelMixin, RetrieveModelMixin,
                                    UpdateModelMixin)
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.decorators import action
+from django.contrib.auth.models import User
+from django.db import transaction
 from django.db.models import QuerySet
 
-from .models import CSVData
+from analytics_backend.admission import admission_controlled
+from .models import CSVData, Team, UploadManifest
 from .serializers import CSVDataSerializer
 
+# the column store and the utils import pandas and numpy, which take a few hundred milliseconds to load,
+# so they are imported by the upload and statistics views only (see analytics_backend.warmup)
+
+# number of rows inserted with one query when uploading csv data
+UPLOAD_BATCH_SIZE = 5000
+
 
 class CsvDataViewSet(ListModelMixin,
                   RetrieveModelMixin,
@@ -34,8 +40,9 @@ class CsvDataViewSet(ListModelMixin,
         Get the csv data created by the current user
         """
         user = self.request.user
-        return CSVData.objects.filter(user=user) 
+        return CSVData.objects.filter(user=user).select_related('team')
 
+    @admission_controlled
     def create(self, request: HttpRequest) -> JsonResponse:
         """
         Upload csv data
@@ -46,48 +53,95 @@ class CsvDataViewSet(ListModelMixin,
         """
         Upload csv data in the database
         """
+        from .partitions import archived_months
+        from .utils import UploadDecoder, UploadTooLarge
+
         response = None
 
         user = request.user
         
         try:
-            data = request.body.decode('utf-8')
-            csv.reader(StringIO(data))
-            df = await asyncio.to_thread(pd.read_csv, StringIO(data))
+            # the body is read from the stream, because request.body is limited by DATA_UPLOAD_MAX_MEMORY_SIZE
+            body_file, file_hash = await asyncio.to_thread(UploadDecoder.spool_body, request.stream,
+                                                           settings.CSVDATA_UPLOAD_MAX_SIZE)
 
-            csv_dicts = df.to_dict('records')
+            with body_file:
+                # an identical file has already been ingested, so there is nothing new to parse
+                if await self.is_file_uploaded(user, file_hash):
+                    return JsonResponse({'message': 'CSV data has already been uploaded'})
 
-            if len(csv_dicts) > 0:
-                for csv_dict in csv_dicts:
-                    keys = csv_dict.keys()
-                    for key in keys:
-                        if key not in ['review_time', 'team', 'date', 'merge_time']:
-                            raise Exception("The CSV data does not have correct format")
-            else:
-                raise Exception("The CSV data does not have correct format")
+                df = await asyncio.to_thread(UploadDecoder.read_data_frame, body_file, request.content_type,
+                                             request.headers.get('Content-Encoding'))
 
-            await self.save_csv_data_to_db(user, csv_dicts)
+            # the rows of archived months would be stored again in the default partition
+            df, archived_rows = UploadDecoder.drop_archived_rows(df, await sync_to_async(archived_months)())
 
-            response = JsonResponse({'message': 'CSV data uploaded successfully'})
+            csv_dicts = df.to_dict('records')
+
+            await self.save_csv_data_to_db(user, file_hash, csv_dicts)
+
+            response = JsonResponse({'message': 'CSV data uploaded successfully', 'archived_rows': archived_rows})
+        except UploadTooLarge as exc:
+            response = JsonResponse({"error_message": str(exc)}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
         except Exception as exc:
             response = JsonResponse({"error_message": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
 
         return response
 
-    async def save_csv_data_to_db(self, user: object, csv_dicts: list[dict[str, Any]]) -> None:
+    @sync_to_async
+    def is_file_uploaded(self, user: User, file_hash: str) -> bool:
+        """
+        Check if a file with the same content has already been uploaded by the user
+        """
+        return UploadManifest.objects.filter(user=user, file_hash=file_hash).exists()
+
+    @sync_to_async
+    def save_csv_data_to_db(self, user: User, file_hash: str, csv_dicts: list[dict[str, Any]]) -> None:
         """
-        Async function to save the csv data in the database
+        Save the csv data in the database, skipping the rows which have already been uploaded
         """
-        loop = asyncio.get_event_loop()
-        tasks = []
+        from .column_store import ColumnStore
+        from .trends import TrendHandler
+
+        team_ids = self.get_team_ids(user, {str(csv_dict['team']) for csv_dict in csv_dicts})
+        rows = []
         for csv_dict in csv_dicts:
-            csv_dict['user'] = user
-            task = loop.create_task(sync_to_async(CSVData.objects.create)(**csv_dict))
-            tasks.append(task)
+            team = str(csv_dict.pop('team'))
+            rows.append(CSVData(user=user, team_id=team_ids[team], **csv_dict))
+
+        with transaction.atomic():
+            CSVData.objects.bulk_create(rows, batch_size=UPLOAD_BATCH_SIZE, ignore_conflicts=True)
+            # only the days of the uploaded rows are aggregated again for the trends
+            TrendHandler.update_daily_aggregates(user, {(row.team_id, row.date) for row in rows})
+            UploadManifest.objects.get_or_create(user=user, file_hash=file_hash,
+                                                 defaults={'row_count': len(rows)})
 
-        await asyncio.gather(*tasks)
+        ColumnStore.refresh(user)
+
+    def get_team_ids(self, user: User, team_names: set[str]) -> dict[str, int]:
+        """
+        Get the ids of the user's teams by name, creating the teams which don't exist yet
+        """
+        Team.objects.bulk_create([Team(user=user, name=name) for name in team_names], ignore_conflicts=True)
+
+        return dict(Team.objects.filter(user=user, name__in=team_names).values_list('name', 'id'))
+
+    def perform_update(self, serializer: CSVDataSerializer) -> None:
+        """
+        Update a row of the csv data, its daily aggregates and invalidate the cached columns of the user
+        """
+        from .column_store import ColumnStore
+        from .trends import TrendHandler
+
+        previous_day = (serializer.instance.team_id, serializer.instance.date)
+        with transaction.atomic():
+            row = serializer.save()
+            TrendHandler.update_daily_aggregates(self.request.user, {previous_day, (row.team_id, row.date)})
+
+        ColumnStore.invalidate(self.request.user.id)
 
     @action(detail=False, methods=['get'], url_path='statistics')
+    @admission_controlled
     def statistics(self, request: HttpRequest) -> JsonResponse:
         """
         API function for retrieving statistics for csv data
@@ -98,51 +152,59 @@ class CsvDataViewSet(ListModelMixin,
         """
         Retrieve the statistics for the csv data
         """
+        from .column_store import ColumnStore
+        from .utils import StatisticsHandler, parse_date_range
+
         user = request.user
         team = request.query_params.get('team')
         
-        csv_data = await sync_to_async(CSVData.objects.filter)(user=user)
+        try:
+            start_date, end_date = parse_date_range(request.query_params)
+        except ValueError as exc:
+            return JsonResponse({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
 
-        csv_data = csv_data.values_list('review_time', 'merge_time', 'team')
-        df = pd.DataFrame(csv_data, columns=['review_time', 'merge_time', 'team'])
-        df = df.astype({'review_time': int, 'merge_time': int})
+        columns = await sync_to_async(ColumnStore.load_columns)(user, start_date, end_date)
 
         if team is not None:
-            df = df[df['team'] == team]
+            columns = ColumnStore.filter_team(columns, team)
 
-        if df.empty:
+        if len(columns['team_codes']) == 0:
             return JsonResponse({'error': 'No data available for the specified team.'}, status=status.HTTP_404_NOT_FOUND)
         
-        team_stats = self.calculate_team_stats(df)
+        team_stats = await asyncio.to_thread(StatisticsHandler.calculate_team_stats_from_codes, columns['teams'],
+                                             columns['team_codes'], columns['review_time'], columns['merge_time'])
 
         return JsonResponse(team_stats, status=status.HTTP_200_OK)
 
-    def calculate_team_stats(self, df: pd.DataFrame) -> dict[str, dict[str, dict[str, Union[float, int]]]]:
+    @action(detail=False, methods=['get'], url_path='trends')
+    @admission_controlled
+    def trends(self, request: HttpRequest) -> JsonResponse:
         """
-        Calculate statistics for each team in the data
+        API function for retrieving the rolling trends of the csv data
         """
-        team_stats = {}
-
-        for team, team_df in df.groupby('team'):
-            team_stats[team] = {
-                'review_time': self.calculate_single_statistics(team_df, 'review_time'),
-                'merge_time': self.calculate_single_statistics(team_df, 'merge_time')
-            }
+        return async_to_sync(self.get_trends)(request)
 
-        return team_stats
-
-    def calculate_single_statistics(self, team_df: pd.DataFrame, col_type: str) -> dict[str, Union[float, int]]:
+    async def get_trends(self, request) -> JsonResponse:
         """
-        Calculate statistics for one part of the data
+        Retrieve the rolling mean and median of every team over the trend windows ending on end_date
         """
-        time_mean = np.mean(team_df[col_type])
-        time_median = np.median(team_df[col_type])
-        time_mode = int(team_df[col_type].mode().iloc[0])
+        from .trends import TrendHandler
+        from .utils import parse_date_range
+
+        user = request.user
+        team = request.query_params.get('team')
+
+        try:
+            _, end_date = parse_date_range(request.query_params)
+        except ValueError as exc:
+            return JsonResponse({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+
+        df, end_date = await sync_to_async(TrendHandler.load_daily_aggregates)(user, end_date, team)
+
+        if df.empty:
+            return JsonResponse({'error': 'No data available for the specified team.'}, status=status.HTTP_404_NOT_FOUND)
 
-        return {
-            'mean': time_mean,
-            'median': time_median,
-            'mode': time_mode
-        }
+        columns = await sync_to_async(TrendHandler.load_trend_columns)(user, end_date, team)
+        trends = await asyncio.to_thread(TrendHandler.calculate_rolling_trends, df, columns, end_date)
 
-    
\ No newline at end of file
+        return JsonResponse({'end_date': end_date.isoformat(), 'teams': trends}, status=status.HTTP_200_OK)
@@ -0,0 +1,165 @@
+import binascii
+import copy
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from knox.auth import TokenAuthentication
+from knox.crypto import hash_token
+from knox.models import AuthToken
+from knox.settings import knox_settings
+
+SHARED_CACHE_KEY_PREFIX = 'knox-token:'
+# revocation markers in the shared cache, which hold the time when a token was evicted
+REVOKED_KEY_PREFIX = 'knox-token-revoked:'
+
+# expiry time, time of the database check, user and token
+CacheEntry = tuple[float, float, User, AuthToken]
+
+
+class TokenCache:
+    """
+    Bounded in-process LRU of authenticated tokens, keyed by the token digest, with an optional shared cache tier.
+
+    Entries are trusted for TOKEN_CACHE_TTL seconds at most and never past the expiry of the knox token.
+    Deleted tokens are evicted from the local LRU and from the shared cache. Without a shared cache the
+    LRUs of the other processes keep them until their entry expires, so TOKEN_CACHE_TTL bounds how long
+    a logout takes to reach every worker. With a shared cache a revocation marker is stored as well,
+    which every process checks on a local hit, so a logout applies to all the workers at once.
+    """
+
+    def __init__(self) -> None:
+        self._entries: OrderedDict[str, CacheEntry] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, digest: str) -> Optional[tuple[User, AuthToken]]:
+        """
+        Get the user and the token of a digest, or None if it is not cached or has been revoked
+        """
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is not None and entry[0] <= time.time():
+                del self._entries[digest]
+                entry = None
+            elif entry is not None:
+                self._entries.move_to_end(digest)
+
+        shared_cache = self.get_shared_cache()
+
+        if entry is not None:
+            if shared_cache is None or not is_revoked(entry, shared_cache.get(REVOKED_KEY_PREFIX + digest)):
+                return entry[2], entry[3]
+
+            with self._lock:
+                self._entries.pop(digest, None)
+            return None
+
+        if shared_cache is not None:
+            values = shared_cache.get_many([SHARED_CACHE_KEY_PREFIX + digest, REVOKED_KEY_PREFIX + digest])
+            entry = values.get(SHARED_CACHE_KEY_PREFIX + digest)
+            if (entry is not None and entry[0] > time.time()
+                    and not is_revoked(entry, values.get(REVOKED_KEY_PREFIX + digest))):
+                self.set_local(digest, entry)
+                return entry[2], entry[3]
+
+        return None
+
+    def set(self, digest: str, user: User, auth_token: AuthToken, checked_at: float) -> None:
+        """
+        Cache the user and the token of a digest, which the database has accepted at checked_at
+        """
+        expires_at = time.time() + settings.TOKEN_CACHE_TTL
+        if auth_token.expiry is not None:
+            expires_at = min(expires_at, auth_token.expiry.timestamp())
+
+        entry = (expires_at, checked_at, user, auth_token)
+        self.set_local(digest, entry)
+
+        shared_cache = self.get_shared_cache()
+        if shared_cache is not None:
+            shared_cache.set(SHARED_CACHE_KEY_PREFIX + digest, entry, timeout=max(1, int(expires_at - time.time())))
+
+    def set_local(self, digest: str, entry: CacheEntry) -> None:
+        """
+        Store an entry in the in-process LRU, evicting the least recently used entries when it is full
+        """
+        with self._lock:
+            self._entries[digest] = entry
+            self._entries.move_to_end(digest)
+            while len(self._entries) > settings.TOKEN_CACHE_MAX_SIZE:
+                self._entries.popitem(last=False)
+
+    def delete(self, digest: str) -> None:
+        """
+        Evict a digest from both tiers, and mark it as revoked for the LRUs of the other processes
+        """
+        with self._lock:
+            self._entries.pop(digest, None)
+
+        shared_cache = self.get_shared_cache()
+        if shared_cache is not None:
+            shared_cache.delete(SHARED_CACHE_KEY_PREFIX + digest)
+            # the entries checked before now expire within TOKEN_CACHE_TTL, so the marker can expire then too
+            shared_cache.set(REVOKED_KEY_PREFIX + digest, time.time(), timeout=settings.TOKEN_CACHE_TTL + 1)
+
+    def clear(self) -> None:
+        """
+        Evict every entry of the in-process LRU
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def get_shared_cache(self):
+        """
+        Get the Django cache used as shared tier, if one is configured
+        """
+        if not settings.TOKEN_CACHE_ALIAS:
+            return None
+
+        return caches[settings.TOKEN_CACHE_ALIAS]
+
+
+def is_revoked(entry: CacheEntry, revoked_at: Optional[float]) -> bool:
+    """
+    Check if a cache entry was created from a database check which happened before the token was revoked
+    """
+    return revoked_at is not None and revoked_at >= entry[1]
+
+
+token_cache = TokenCache()
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    Knox token authentication which caches the authenticated tokens, so repeat requests don't query the database
+    """
+
+    def authenticate_credentials(self, token: bytes) -> tuple[User, AuthToken]:
+        """
+        Authenticate the token from the cache, falling back to knox on a miss
+        """
+        try:
+            digest = hash_token(token.decode('utf-8'))
+        except (TypeError, UnicodeDecodeError, binascii.Error):
+            # let knox reject the malformed token
+            return super().authenticate_credentials(token)
+
+        cached = token_cache.get(digest)
+        if cached is not None:
+            user, auth_token = cached
+            if knox_settings.AUTO_REFRESH and auth_token.expiry:
+                self.renew_token(auth_token)
+
+            # every request gets its own copy, so changes to request.user are not shared
+            return copy.copy(user), auth_token
+
+        # taken before the database check, so a revocation during the check invalidates the entry
+        checked_at = time.time()
+        user, auth_token = super().authenticate_credentials(token)
+        token_cache.set(digest, user, auth_token, checked_at)
+
+        return user, auth_token
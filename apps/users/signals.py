@@ -0,0 +1,23 @@
+from django.contrib.auth.models import User
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from knox.models import AuthToken
+
+from .authentication import token_cache
+
+
+@receiver(post_delete, sender=AuthToken)
+def evict_deleted_token(sender: type, instance: AuthToken, **kwargs) -> None:
+    """
+    Evict a token from the cache when it is deleted by a logout, a logout of all sessions or its expiry
+    """
+    token_cache.delete(instance.digest)
+
+
+@receiver(post_save, sender=User)
+def evict_user_tokens(sender: type, instance: User, **kwargs) -> None:
+    """
+    Evict the tokens of a user which has been changed, e.g. deactivated
+    """
+    for digest in AuthToken.objects.filter(user=instance).values_list('digest', flat=True):
+        token_cache.delete(digest)
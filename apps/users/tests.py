@@ -1,3 +1,142 @@
-from django.test import TestCase
+import json
+import subprocess
+import sys
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.test import SimpleTestCase, override_settings
+from knox.crypto import hash_token
+from knox.models import AuthToken
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.test import APIClient
+from rest_framework.test import APITestCase
+from rest_framework import status
+
+from .authentication import CachedTokenAuthentication, token_cache
+
+class CachedTokenAuthenticationTestCase(APITestCase):
+    """
+    Test suite for the cached token authentication
+    """
+
+    def setUp(self):
+        """Set up the test suite"""
+        self.user = User.objects.create_user(
+            username="testuser1",
+            password="test_password1"
+        )
+
+        _, self.token = AuthToken.objects.create(self.user)
+
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token)
+
+    def test_authenticate_from_cache(self):
+        # arrange
+        authentication = CachedTokenAuthentication()
+        authentication.authenticate_credentials(self.token.encode())
+
+        # act
+        with self.assertNumQueries(0):
+            user, _ = authentication.authenticate_credentials(self.token.encode())
+
+        # assert
+        self.assertEqual(user, self.user)
+
+    def test_logout_evicts_token(self):
+        # arrange
+        authentication = CachedTokenAuthentication()
+        authentication.authenticate_credentials(self.token.encode())
+
+        # act
+        response = self.client.post('/api/v1/logout/')
+
+        # assert
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        with self.assertRaises(AuthenticationFailed):
+            authentication.authenticate_credentials(self.token.encode())
+
+    def test_deactivated_user_is_evicted(self):
+        # arrange
+        authentication = CachedTokenAuthentication()
+        authentication.authenticate_credentials(self.token.encode())
+
+        # act
+        self.user.is_active = False
+        self.user.save()
+
+        # assert
+        with self.assertRaises(AuthenticationFailed):
+            authentication.authenticate_credentials(self.token.encode())
+
+
+    @override_settings(TOKEN_CACHE_ALIAS='default')
+    def test_logout_revokes_token_in_other_processes(self):
+        # arrange
+        caches['default'].clear()
+        authentication = CachedTokenAuthentication()
+        authentication.authenticate_credentials(self.token.encode())
+        digest = hash_token(self.token)
+        other_process_entry = token_cache._entries[digest]
+
+        # act
+        self.client.post('/api/v1/logout/')
+        # the LRU of another worker still holds the entry
+        token_cache.set_local(digest, other_process_entry)
+
+        # assert
+        with self.assertRaises(AuthenticationFailed):
+            authentication.authenticate_credentials(self.token.encode())
+
+    @override_settings(TOKEN_CACHE_ALIAS='default')
+    def test_token_is_cached_again_after_revocation_of_other_token(self):
+        # arrange
+        caches['default'].clear()
+        authentication = CachedTokenAuthentication()
+
+        # act
+        self.user.first_name = 'changed'
+        self.user.save()
+        authentication.authenticate_credentials(self.token.encode())
+
+        # assert
+        with self.assertNumQueries(0):
+            user, _ = authentication.authenticate_credentials(self.token.encode())
+        self.assertEqual(user.first_name, 'changed')
+
+class StartupImportTestCase(SimpleTestCase):
+    """
+    Test suite for the modules loaded at startup, which run in a fresh interpreter
+    """
+
+    # the analytics stack is imported on first use, see analytics_backend.warmup
+    HEAVY_MODULES = ('pandas', 'numpy', 'matplotlib', 'PIL', 'pyarrow')
+
+    def get_loaded_modules(self, code):
+        """Run the code after setting up Django and get the heavy modules which it has loaded"""
+        script = (
+            'import django, json, sys\n'
+            'django.setup()\n'
+            f'{code}\n'
+            f'print(json.dumps([module for module in {self.HEAVY_MODULES!r} if module in sys.modules]))\n'
+        )
+        result = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, check=True)
+
+        return json.loads(result.stdout.splitlines()[-1])
+
+    def test_urls_do_not_load_analytics_modules(self):
+        # act
+        loaded_modules = self.get_loaded_modules('import analytics_backend.urls')
+
+        # assert
+        self.assertEqual(loaded_modules, [])
+
+    def test_warm_up_loads_analytics_modules(self):
+        # act
+        loaded_modules = self.get_loaded_modules(
+            'from analytics_backend.warmup import warm_up\n'
+            'warm_up()'
+        )
+
+        # assert
+        self.assertTrue({'pandas', 'numpy', 'matplotlib', 'PIL'}.issubset(loaded_modules))
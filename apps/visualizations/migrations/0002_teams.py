@@ -0,0 +1,62 @@
+# Generated by Django 4.1.6 on 2026-10-19 14:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('csvdata', '0003_team'),
+        ('visualizations', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RenameField(
+            model_name='visualization',
+            old_name='teams',
+            new_name='team_names',
+        ),
+        migrations.AddField(
+            model_name='visualization',
+            name='teams',
+            field=models.ManyToManyField(blank=True, related_name='visualizations', to='csvdata.team'),
+        ),
+        # link the visualizations to the teams, the names were stored with the spaces replaced by underscores
+        migrations.RunSQL(
+            sql=[
+                """
+                INSERT INTO csvdata_team (user_id, name)
+                SELECT DISTINCT visualization.user_id, team_name.name
+                FROM visualizations_visualization visualization
+                CROSS JOIN unnest(visualization.team_names) AS team_name(name)
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM csvdata_team team
+                    WHERE team.user_id = visualization.user_id
+                      AND (team.name = team_name.name OR replace(team.name, ' ', '_') = team_name.name)
+                )
+                """,
+                """
+                INSERT INTO visualizations_visualization_teams (visualization_id, team_id)
+                SELECT DISTINCT visualization.id, team.id
+                FROM visualizations_visualization visualization
+                CROSS JOIN unnest(visualization.team_names) AS team_name(name)
+                JOIN csvdata_team team
+                  ON team.user_id = visualization.user_id
+                 AND (team.name = team_name.name OR replace(team.name, ' ', '_') = team_name.name)
+                """,
+            ],
+            reverse_sql="""
+                UPDATE visualizations_visualization visualization
+                SET team_names = ARRAY(
+                    SELECT team.name
+                    FROM visualizations_visualization_teams visualization_team
+                    JOIN csvdata_team team ON team.id = visualization_team.team_id
+                    WHERE visualization_team.visualization_id = visualization.id
+                )
+            """,
+        ),
+        migrations.RemoveField(
+            model_name='visualization',
+            name='team_names',
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.1.6 on 2026-10-19 13:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('visualizations', '0002_teams'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='visualization',
+            name='file_path',
+            field=models.CharField(db_index=True, max_length=255),
+        ),
+    ]
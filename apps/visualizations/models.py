@@ -1,11 +1,12 @@
 from django.db import models
 from django.contrib.auth.models import User
-from django.contrib.postgres.fields import ArrayField
+
+from apps.csvdata.models import Team
 
 class Visualization(models.Model):
     user               = models.ForeignKey(User, on_delete=models.CASCADE)
     visualization_type = models.CharField(max_length=50)
-    file_path          = models.CharField(max_length=255)
+    file_path          = models.CharField(max_length=255, db_index=True)
     created_at         = models.DateTimeField(auto_now_add=True)
-    teams              = ArrayField(models.CharField(max_length=50), blank=True)
+    teams              = models.ManyToManyField(Team, related_name='visualizations', blank=True)
     shared_with        = models.ManyToManyField(User, related_name='shared_visualizations', blank=True)
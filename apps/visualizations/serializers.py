@@ -2,6 +2,14 @@ from rest_framework import serializers
 from .models import Visualization
 
 class VisualizationSerializer(serializers.ModelSerializer):
+    teams = serializers.SerializerMethodField()
+
     class Meta:
         model = Visualization
         fields = ['id', 'user', 'visualization_type', 'file_path', 'created_at', 'teams']
+
+    def get_teams(self, visualization: Visualization) -> list[str]:
+        """
+        Get the names of the teams shown in the visualization
+        """
+        return [team.name for team in visualization.teams.all()]
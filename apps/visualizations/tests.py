@@ -1,5 +1,14 @@
+import os
+import tempfile
+import threading
+
+import pandas as pd
+from asgiref.sync import async_to_sync
 from django.contrib.auth.models import User
+from django.test import SimpleTestCase, override_settings
+from PIL import Image
 from .models import Visualization
+from .utils import PlottingHandler
 from knox.models import AuthToken
 from rest_framework.test import APIClient
 from rest_framework.test import APITestCase
@@ -36,4 +45,135 @@ class VisualizationTestCase(APITestCase):
         print(str(response))
         # assert
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-    
+
+    def test_get_chart_file(self):
+        # arrange
+        self.client.post('/api/v1/csvdata/', data=VisualizationTestCase.DUMMY_CSV_DATA, content_type='text')
+        self.client.post('/api/v1/visualizations/?type=line&team=Team A')
+        file_path = Visualization.objects.get(user=self.first_user).file_path
+
+        # act
+        response = self.client.get(file_path)
+        cached_response = self.client.get(file_path, HTTP_IF_NONE_MATCH=response['ETag'])
+
+        # assert
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertIn('Last-Modified', response)
+        self.assertEqual(cached_response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_regenerated_charts_get_new_files(self):
+        # arrange
+        self.client.post('/api/v1/csvdata/', data=VisualizationTestCase.DUMMY_CSV_DATA, content_type='text')
+
+        # act
+        self.client.post('/api/v1/visualizations/?type=line&team=Team A')
+        self.client.post('/api/v1/visualizations/?type=line&team=Team A')
+
+        # assert
+        file_paths = Visualization.objects.filter(user=self.first_user).values_list('file_path', flat=True)
+        self.assertEqual(len(set(file_paths)), 2)
+
+    def test_get_chart_file_of_other_user(self):
+        # arrange
+        self.client.post('/api/v1/csvdata/', data=VisualizationTestCase.DUMMY_CSV_DATA, content_type='text')
+        self.client.post('/api/v1/visualizations/?type=line&team=Team A')
+        file_path = Visualization.objects.get(user=self.first_user).file_path
+
+        _, token = AuthToken.objects.create(self.second_user)
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION='Token ' + token)
+
+        # act
+        response = client.get(file_path)
+
+        # assert
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_create_visualizations_image_options(self):
+        # arrange
+        self.client.post('/api/v1/csvdata/', data=VisualizationTestCase.DUMMY_CSV_DATA, content_type='text')
+
+        # act
+        response = self.client.post('/api/v1/visualizations/?type=bar&image_format=webp&dpi=50&size=8x4')
+
+        # assert
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(all(path['file_url'].endswith('.webp') for path in response.json()['paths']))
+
+    def test_create_visualizations_wrong_image_format(self):
+        # arrange
+        self.client.post('/api/v1/csvdata/', data=VisualizationTestCase.DUMMY_CSV_DATA, content_type='text')
+
+        # act
+        response = self.client.post('/api/v1/visualizations/?image_format=gif')
+
+        # assert
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_get_chart_thumbnail(self):
+        # arrange
+        self.client.post('/api/v1/csvdata/', data=VisualizationTestCase.DUMMY_CSV_DATA, content_type='text')
+        self.client.post('/api/v1/visualizations/?type=line&team=Team A')
+        file_path = Visualization.objects.get(user=self.first_user).file_path
+
+        # act
+        response = self.client.get(file_path + '?thumbnail=true')
+
+        # assert
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(os.path.exists(file_path.replace('.png', '.thumbnail.png')))
+
+    def test_create_visualizations_grid_layout(self):
+        # arrange
+        self.client.post('/api/v1/csvdata/', data=VisualizationTestCase.DUMMY_CSV_DATA, content_type='text')
+
+        # act
+        response = self.client.post('/api/v1/visualizations/?type=line&layout=grid')
+
+        # assert
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        visualization = Visualization.objects.get(user=self.first_user)
+        self.assertEqual(sorted(visualization.teams.values_list('name', flat=True)), ['Team A', 'Team B'])
+
+    @override_settings(CHART_MAX_PIXELS=200000)
+    def test_grid_chart_size_is_limited(self):
+        # arrange
+        self.client.post('/api/v1/csvdata/', data=VisualizationTestCase.DUMMY_CSV_DATA, content_type='text')
+
+        # act
+        self.client.post('/api/v1/visualizations/?type=line&layout=grid&dpi=300')
+
+        # assert
+        with Image.open(Visualization.objects.get(user=self.first_user).file_path) as image:
+            self.assertLessEqual(image.width * image.height, 200000)
+
+
+class PlottingHandlerTestCase(SimpleTestCase):
+    """
+    Test suite for the chart rendering
+    """
+    DUMMY_TEAM_DATA_FRAME = pd.DataFrame({'review_time': [30, 20], 'merge_time': [10, 7]},
+                                         index=pd.DatetimeIndex(['2023-04-14', '2023-04-15']))
+
+    def test_create_charts_in_threads(self):
+        with tempfile.TemporaryDirectory() as chart_root:
+            # arrange
+            file_paths = [os.path.join(chart_root, f'chart_{index}.png') for index in range(8)]
+            threads = [
+                threading.Thread(target=async_to_sync(PlottingHandler.create_chart),
+                                 args=('line', file_path, 'Team A', PlottingHandlerTestCase.DUMMY_TEAM_DATA_FRAME),
+                                 kwargs={'size': (4.0, 3.0)})
+                for file_path in file_paths
+            ]
+
+            # act
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+            # assert
+            for file_path in file_paths:
+                with Image.open(file_path) as image:
+                    self.assertEqual(image.size, (400, 300))
@@ -1,101 +1,185 @@
+import math
 import os
+import threading
+from typing import Optional
 import numpy as np
-import matplotlib.pyplot as plt
 import pandas as pd
+from matplotlib.axes import Axes
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from django.conf import settings
+from PIL import Image
 
 FILE_URL_PREFIX = "http://127.0.0.1:8000"
 
+IMAGE_FORMATS = ('png', 'webp', 'svg')
+DEFAULT_IMAGE_FORMAT = 'png'
+DEFAULT_DPI = 100
+DEFAULT_SIZE = (20.0, 10.0)
+# size in inches of one team's panel in the grid layout
+GRID_PANEL_SIZE = (6.0, 4.0)
+
 class PlottingHandler:
     """
     Handler class which contains static methods to create and save plots
     """
     
     @staticmethod
-    async def create_chart(chart_type: str, file_path: str, team: str, team_df: pd.DataFrame) -> None:
+    async def create_chart(chart_type: str, file_path: str, team: str, team_df: pd.DataFrame,
+                           dpi: int = DEFAULT_DPI, size: Optional[tuple[float, float]] = None) -> None:
+        """
+        Create chart based on the chart type provided and store it on disk. The image format is given by the file extension
+        """
+        fig = create_figure(figsize=limit_figure_size(size or DEFAULT_SIZE, dpi))
+        ax = fig.subplots()
+
+        PlottingHandler.draw_chart(chart_type, ax, team_df)
+
+        ax.set_xlabel('Date')
+        ax.set_ylabel('Duration (s)')
+        ax.set_title(f'{team} Review and Merge Times')
+        ax.legend()
+
+        await PlottingHandler.save_plot(fig, file_path, dpi)
+
+    @staticmethod
+    async def create_grid_chart(chart_type: str, file_path: str, team_dfs: dict[str, pd.DataFrame],
+                                dpi: int = DEFAULT_DPI, size: Optional[tuple[float, float]] = None) -> None:
+        """
+        Create one figure with a chart for every team, sharing the axes, and store it on disk
+        """
+        columns = math.ceil(math.sqrt(len(team_dfs)))
+        rows = math.ceil(len(team_dfs) / columns)
+        # the panels are shrunk when a large grid would exceed CHART_MAX_PIXELS
+        size = limit_figure_size(size or (GRID_PANEL_SIZE[0] * columns, GRID_PANEL_SIZE[1] * rows), dpi)
+
+        fig = create_figure(figsize=size, layout='constrained')
+        axes = fig.subplots(rows, columns, sharex=True, sharey=True, squeeze=False)
+
+        # align the teams on the same days, so the shared x axis means the same in every panel
+        dates = pd.DatetimeIndex([])
+        for team_df in team_dfs.values():
+            dates = dates.union(team_df.index)
+
+        for ax, (team, team_df) in zip(axes.flat, team_dfs.items()):
+            PlottingHandler.draw_chart(chart_type, ax, team_df.reindex(dates))
+            ax.set_title(team)
+
+        # hide the panels which are left over in the last row, and show the dates on the panels above them
+        for index in range(len(team_dfs), rows * columns):
+            axes.flat[index].set_visible(False)
+            axes.flat[index - columns].tick_params(axis='x', labelbottom=True)
+
+        fig.supxlabel('Date')
+        fig.supylabel('Duration (s)')
+        fig.suptitle('Review and Merge Times')
+        fig.legend(*axes.flat[0].get_legend_handles_labels(), loc='upper right')
+
+        await PlottingHandler.save_plot(fig, file_path, dpi)
+
+    @staticmethod
+    def draw_chart(chart_type: str, ax: Axes, team_df: pd.DataFrame) -> None:
         """
-        Create chart based on the chart type provided
+        Draw the chart type provided on the axes
         """
         if chart_type == 'line':
-            await PlottingHandler.create_line_chart(file_path, team, team_df)
+            PlottingHandler.draw_line_chart(ax, team_df)
         elif chart_type == 'bar':
-            await PlottingHandler.create_bar_chart(file_path, team, team_df)
+            PlottingHandler.draw_bar_chart(ax, team_df)
         elif chart_type == 'scatter':
-            await PlottingHandler.create_scatter_plot(file_path, team, team_df)
+            PlottingHandler.draw_scatter_plot(ax, team_df)
 
     @staticmethod
-    async def create_line_chart(file_path: str, team: str, team_df: pd.DataFrame) -> None:
+    def draw_line_chart(ax: Axes, team_df: pd.DataFrame) -> None:
         """
-        Create line chart for the data provided and store it on disk
+        Draw line chart for the data provided
         """
-        plt.figure(figsize=(20, 10))
-
-        plt.plot(team_df.index, team_df['review_time'], label='Review Time')
-        plt.plot(team_df.index, team_df['merge_time'], label='Merge Time')
+        ax.plot(team_df.index, team_df['review_time'], label='Review Time')
+        ax.plot(team_df.index, team_df['merge_time'], label='Merge Time')
 
-        plt.xlabel('Date')
-        plt.ylabel('Duration (s)')
-        plt.title(f'{team} Review and Merge Times')
-        plt.legend()
-        plt.xticks(rotation=90)
-
-        await PlottingHandler.save_plot(file_path)
+        ax.tick_params(axis='x', labelrotation=90)
     
     @staticmethod
-    async def create_bar_chart(file_path: str, team: str, team_df: pd.DataFrame) -> None:
+    def draw_bar_chart(ax: Axes, team_df: pd.DataFrame) -> None:
         """
-        Create bar chart for the data provided and store it on disk
+        Draw bar chart for the data provided
         """
-        plt.figure(figsize=(20, 10))
-
         width = 0.35
-        fig, ax = plt.subplots(figsize=(20, 10))
         
         # create a list of x positions for the bars
         x = np.arange(len(team_df))
         
         # plot review time and merge time as stacked bars
-        rects1 = ax.bar(x, team_df['review_time'], width, label='Review Time')
-        rects2 = ax.bar(x, team_df['merge_time'], width, bottom=team_df['review_time'], label='Merge Time')
+        ax.bar(x, team_df['review_time'], width, label='Review Time')
+        ax.bar(x, team_df['merge_time'], width, bottom=team_df['review_time'], label='Merge Time')
         
         # set x labels to be the dates in the DataFrame
         ax.set_xticks(x)
         ax.set_xticklabels(team_df.index.strftime('%Y-%m-%d'), rotation=90)
-        
-        ax.set_xlabel('Date')
-        ax.set_ylabel('Duration (s)')
-        ax.set_title(f'{team} Review and Merge Times')
-        ax.legend()
-        
-        await PlottingHandler.save_plot(file_path)
 
     @staticmethod
-    async def create_scatter_plot(file_path: str, team: str, team_df: pd.DataFrame) -> None:
+    def draw_scatter_plot(ax: Axes, team_df: pd.DataFrame) -> None:
         """
-        Create scatter plot for the data provided and store it on disk
+        Draw scatter plot for the data provided
         """
-        plt.figure(figsize=(20, 10))
-
-        plt.scatter(team_df.index, team_df['review_time'], label='Review Time')
-        plt.scatter(team_df.index, team_df['merge_time'], label='Merge Time')
-
-        plt.xlabel('Date')
-        plt.ylabel('Duration (s)')
-        plt.title(f'{team} Review and Merge Times')
-        plt.legend()
-        plt.xticks(rotation=90)
+        ax.scatter(team_df.index, team_df['review_time'], label='Review Time')
+        ax.scatter(team_df.index, team_df['merge_time'], label='Merge Time')
 
-        await PlottingHandler.save_plot(file_path)
+        ax.tick_params(axis='x', labelrotation=90)
 
     @staticmethod
-    async def save_plot(file_path: str) -> None:
+    async def save_plot(fig: Figure, file_path: str, dpi: int) -> None:
         """
         Save plot on disk
         """
         # create the directory if it doesn't exist
         os.makedirs(os.path.dirname(file_path), exist_ok=True)
 
-        # save the plot to the file path
-        plt.savefig(file_path)
+        # save the plot to the file path, the figure is not registered anywhere so it is freed with the last reference
+        fig.savefig(file_path, dpi=dpi)
+
+    @staticmethod
+    def get_thumbnail(file_path: str) -> str:
+        """
+        Get the path of the thumbnail of a chart, creating it next to the chart on first use
+        """
+        root, extension = os.path.splitext(file_path)
+
+        # vector charts scale without losing quality, so they are their own thumbnail
+        if extension == '.svg':
+            return file_path
+
+        thumbnail_path = f'{root}.thumbnail{extension}'
+        if not os.path.exists(thumbnail_path):
+            with Image.open(file_path) as image:
+                image.thumbnail(settings.CHART_THUMBNAIL_SIZE)
+
+                # write to a temporary file first, so concurrent requests never serve a partial thumbnail
+                temp_path = f'{root}.thumbnail-{os.getpid()}-{threading.get_ident()}{extension}'
+                image.save(temp_path)
+                os.replace(temp_path, thumbnail_path)
+
+        return thumbnail_path
+
+
+def create_figure(**kwargs) -> Figure:
+    """
+    Create a figure rendered by Agg without pyplot, whose global figure manager is not thread-safe
+    """
+    fig = Figure(**kwargs)
+    FigureCanvasAgg(fig)
+
+    return fig
+
+
+def limit_figure_size(size: tuple[float, float], dpi: int) -> tuple[float, float]:
+    """
+    Scale the figure size in inches down, keeping its aspect ratio, so the rendered image has at most CHART_MAX_PIXELS pixels
+    """
+    width, height = size
+    scale = math.sqrt(settings.CHART_MAX_PIXELS / (width * dpi * height * dpi))
+
+    if scale >= 1:
+        return size
 
-        # clear the plot
-        plt.clf()
+    return width * scale, height * scale
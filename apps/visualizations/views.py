@@ -1,21 +1,41 @@
+from __future__ import annotations
+
 from datetime import datetime
 import asyncio
+import mimetypes
+import os
+import uuid
+from typing import TYPE_CHECKING, Optional
 
-import pandas as pd
 from asgiref.sync import async_to_sync, sync_to_async
 from rest_framework.permissions import IsAuthenticated
-from django.http import JsonResponse, HttpRequest
+from rest_framework.authentication import SessionAuthentication
+from rest_framework.views import APIView
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse, HttpRequest
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
 from django.shortcuts import get_object_or_404
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
 from django.contrib.auth.models import User
 from rest_framework.mixins import ListModelMixin, RetrieveModelMixin, UpdateModelMixin
-from django.db.models import QuerySet
+from django.db.models import Q, QuerySet
 
 from .serializers import VisualizationSerializer
 from .models import Visualization
-from .utils import PlottingHandler, FILE_URL_PREFIX
-from apps.csvdata.models import CSVData
+from analytics_backend.admission import admission_controlled
+from apps.users.authentication import CachedTokenAuthentication
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+# matplotlib, pandas and numpy are imported by the methods which render charts, so listing, sharing
+# and serving the chart files don't load them
+
+# limits of the image options, to keep the rendering time and the file size bounded
+MIN_DPI, MAX_DPI = 20, 300
+MIN_SIZE, MAX_SIZE = 1.0, 40.0
 
 
 class VisualizationViewSet(ListModelMixin, RetrieveModelMixin, UpdateModelMixin, viewsets.GenericViewSet):
@@ -28,8 +48,9 @@ class VisualizationViewSet(ListModelMixin, RetrieveModelMixin, UpdateModelMixin,
         Get the visualization for logged in user
         """
         user = self.request.user
-        return Visualization.objects.filter(user=user)
+        return Visualization.objects.filter(user=user).prefetch_related('teams')
 
+    @admission_controlled
     def create(self, request: HttpRequest) -> JsonResponse:
         """
         Create visualizations for the csv data uploaded by the current user
@@ -40,12 +61,15 @@ class VisualizationViewSet(ListModelMixin, RetrieveModelMixin, UpdateModelMixin,
         """
         Create the plots for the data, store them on disk and in the database.
         """
+        import pandas as pd
+        from apps.csvdata.column_store import ColumnStore
+        from apps.csvdata.utils import parse_date_range
+
         user = request.user
 
         team = request.query_params.get('team')
         chart_type = request.query_params.get('type')
-
-        csv_data: QuerySet[CSVData] = await sync_to_async(CSVData.objects.filter)(user=user)
+        layout = request.query_params.get('layout', 'single')
 
         chart_types = []
         if chart_type is not None:
@@ -53,29 +77,48 @@ class VisualizationViewSet(ListModelMixin, RetrieveModelMixin, UpdateModelMixin,
         else:
             chart_types = ['line', 'bar', 'scatter']
 
-        csv_data = csv_data.values_list('review_time', 'merge_time', 'date', 'team')
-        df = pd.DataFrame(csv_data, columns=['review_time', 'merge_time', 'date', 'team'])
-        df = df.astype({'review_time': int, 'merge_time': int})
+        if layout not in ('single', 'grid'):
+            return JsonResponse({'error': 'The layout must be single or grid'}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            image_format, dpi, size = self.parse_image_options(request)
+            start_date, end_date = parse_date_range(request.query_params)
+        except ValueError as exc:
+            return JsonResponse({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+
+        columns = await sync_to_async(ColumnStore.load_columns)(user, start_date, end_date)
 
         if team is not None:
-            df = df[df['team'] == team]
+            columns = ColumnStore.filter_team(columns, team)
+
+        df = ColumnStore.to_data_frame(columns)
+        team_ids = dict(zip(columns['teams'], columns['team_ids']))
 
         if df.empty:
             return JsonResponse({'error': 'No data available for the specified team.'}, status=status.HTTP_404_NOT_FOUND)
 
-        tasks: list[asyncio.Task] = []
-        for team, team_df in df.groupby('team'):
+        team_dfs: dict[str, pd.DataFrame] = {}
+        for team, team_df in df.groupby('team', observed=True):
             # Convert date strings to datetime objects and set them as the index
             team_df['date'] = pd.to_datetime(team_df['date'])
-            team_df = team_df.set_index('date')
+            team_df = team_df.drop(columns='team').set_index('date')
 
             # Resample the data to a daily frequency and interpolate missing values
             team_df = team_df.resample('D').mean()
-            team_df = team_df.interpolate()
+            team_dfs[team] = team_df.interpolate()
 
-            for chart_type in chart_types:
-                task = asyncio.ensure_future(self.create_chart(user, team, team_df, chart_type))
+        tasks: list[asyncio.Task] = []
+        for chart_type in chart_types:
+            if layout == 'grid':
+                # all the teams are rendered in one figure and stored as one visualization
+                task = asyncio.ensure_future(self.create_grid_chart(user, team_dfs, team_ids, chart_type,
+                                                                    image_format, dpi, size))
                 tasks.append(task)
+            else:
+                for team, team_df in team_dfs.items():
+                    task = asyncio.ensure_future(self.create_chart(user, team, int(team_ids[team]), team_df, chart_type,
+                                                                   image_format, dpi, size))
+                    tasks.append(task)
 
         file_paths: list[dict] = await asyncio.gather(*tasks)
 
@@ -118,7 +161,7 @@ class VisualizationViewSet(ListModelMixin, RetrieveModelMixin, UpdateModelMixin,
         response = None
         try:
             user = request.user
-            shared_visualizations: QuerySet[Visualization] = Visualization.objects.filter(shared_with=user)
+            shared_visualizations: QuerySet[Visualization] = Visualization.objects.filter(shared_with=user).prefetch_related('teams')
 
             serializer = VisualizationSerializer(shared_visualizations, many=True)
 
@@ -128,33 +171,144 @@ class VisualizationViewSet(ListModelMixin, RetrieveModelMixin, UpdateModelMixin,
 
         return response
 
-    async def create_chart(self, user: User, team: str, team_df: pd.DataFrame, chart_type: str) -> dict:
+    def parse_image_options(self, request: HttpRequest) -> tuple[str, int, Optional[tuple[float, float]]]:
+        """
+        Get the image format, the dpi and the size in inches (e.g. 8x4) of the charts from the query parameters
+        """
+        from .utils import IMAGE_FORMATS, DEFAULT_IMAGE_FORMAT, DEFAULT_DPI
+
+        image_format = request.query_params.get('image_format', DEFAULT_IMAGE_FORMAT).lower()
+        if image_format not in IMAGE_FORMATS:
+            raise ValueError(f'The image format must be one of: {", ".join(IMAGE_FORMATS)}')
+
+        dpi = int(request.query_params.get('dpi', DEFAULT_DPI))
+        if not MIN_DPI <= dpi <= MAX_DPI:
+            raise ValueError(f'The dpi must be between {MIN_DPI} and {MAX_DPI}')
+
+        size = request.query_params.get('size')
+        if size is not None:
+            width, _, height = size.lower().partition('x')
+            size = (float(width), float(height))
+            if not all(MIN_SIZE <= dimension <= MAX_SIZE for dimension in size):
+                raise ValueError(f'The width and height must be between {MIN_SIZE} and {MAX_SIZE} inches')
+
+        return image_format, dpi, size
+
+    async def create_chart(self, user: User, team: str, team_id: int, team_df: pd.DataFrame, chart_type: str,
+                           image_format: str, dpi: int, size: Optional[tuple[float, float]]) -> dict:
         """
-        Create a png chart and store it in the database
+        Create a chart file and store it in the database
         """
-        file_path = f'/visualizations/{user.id}/{chart_type}/{team}_{datetime.now().strftime("%Y%m%d%H%M%S")}.png'
+        from .utils import PlottingHandler, FILE_URL_PREFIX
+
+        file_path = f'/visualizations/{user.id}/{chart_type}/{team}_{datetime.now().strftime("%Y%m%d%H%M%S")}_{uuid.uuid4().hex}.{image_format}'
 
         file_url = FILE_URL_PREFIX + file_path
         
         team = team.replace(" ", "_")
 
-        await PlottingHandler.create_chart(chart_type, file_path, team, team_df)
+        await PlottingHandler.create_chart(chart_type, file_path, team, team_df, dpi, size)
 
-        await self.create_visualization_in_db(user, chart_type, file_path, team)
+        await self.create_visualization_in_db(user, chart_type, file_path, [team_id])
 
         return {'team': team,
                 'file_url': file_url,
+                'thumbnail_url': file_url + '?thumbnail=true',
                 'chart_type': 'line'}
     
+    async def create_grid_chart(self, user: User, team_dfs: dict[str, pd.DataFrame], team_ids: dict[str, int],
+                                chart_type: str, image_format: str, dpi: int, size: Optional[tuple[float, float]]) -> dict:
+        """
+        Create a chart file with a panel for every team and store it in the database
+        """
+        from .utils import PlottingHandler, FILE_URL_PREFIX
+
+        file_path = f'/visualizations/{user.id}/{chart_type}/grid_{datetime.now().strftime("%Y%m%d%H%M%S")}_{uuid.uuid4().hex}.{image_format}'
+
+        file_url = FILE_URL_PREFIX + file_path
+
+        await PlottingHandler.create_grid_chart(chart_type, file_path, team_dfs, dpi, size)
+
+        await self.create_visualization_in_db(user, chart_type, file_path, [int(team_ids[team]) for team in team_dfs])
+
+        return {'teams': list(team_dfs),
+                'file_url': file_url,
+                'thumbnail_url': file_url + '?thumbnail=true',
+                'chart_type': chart_type}
+
     @sync_to_async
-    def create_visualization_in_db(self, user: User, chart_type: str, file_path: str, team: str) -> None:
+    def create_visualization_in_db(self, user: User, chart_type: str, file_path: str, team_ids: list[int]) -> None:
         """
         Create a visualization in the database
         """
-        Visualization.objects.create(
+        visualization = Visualization.objects.create(
             user=user,
             visualization_type=chart_type,
             file_path=file_path,
-            teams=[team],
         )
+        visualization.teams.set(team_ids)
+
+
+class ChartFileView(APIView):
+    """
+    View which serves the chart files to their owner and to the users they are shared with
+    """
+    # the session is accepted as well, so the charts can be loaded by img tags in the browser
+    authentication_classes = (CachedTokenAuthentication, SessionAuthentication)
+    permission_classes = (IsAuthenticated,)
+
+    def get(self, request: HttpRequest, file_name: str) -> HttpResponse:
+        """
+        Serve a chart file or its thumbnail, answering with 304 when the client already has it
+        """
+        file_path = os.path.join(settings.MEDIA_ROOT, file_name)
+
+        is_visible = Visualization.objects.filter(
+            Q(user=request.user) | Q(shared_with=request.user),
+            file_path=file_path
+        ).exists()
+
+        if not is_visible:
+            raise Http404
+
+        try:
+            if request.query_params.get('thumbnail') == 'true':
+                from .utils import PlottingHandler
+                file_path = PlottingHandler.get_thumbnail(file_path)
+                file_name = os.path.relpath(file_path, settings.MEDIA_ROOT)
 
+            file_stat = os.stat(file_path)
+        except FileNotFoundError:
+            raise Http404
+
+        # every chart gets a new file name, so the files are never modified after they are created
+        # and the stat identifies the content
+        etag = f'"{file_stat.st_ino:x}-{file_stat.st_size:x}-{file_stat.st_mtime_ns:x}"'
+
+        response = get_conditional_response(request, etag=etag, last_modified=int(file_stat.st_mtime))
+        if response is None:
+            response = self.file_response(file_path, file_name)
+
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(file_stat.st_mtime)
+        response['Cache-Control'] = f'private, max-age={settings.CHART_FILE_MAX_AGE}, immutable'
+
+        return response
+
+    def file_response(self, file_path: str, file_name: str) -> HttpResponse:
+        """
+        Create the response which transfers the file, handing it off to the web server when configured
+        """
+        content_type = mimetypes.guess_type(file_path)[0] or 'application/octet-stream'
+
+        if settings.CHART_FILE_SENDFILE == 'x-accel-redirect':
+            response = HttpResponse(content_type=content_type)
+            response['X-Accel-Redirect'] = settings.CHART_FILE_ACCEL_REDIRECT_PREFIX + file_name
+        elif settings.CHART_FILE_SENDFILE == 'x-sendfile':
+            response = HttpResponse(content_type=content_type)
+            response['X-Sendfile'] = file_path
+        else:
+            # the WSGI server's file wrapper transfers the file with sendfile when it is available
+            response = FileResponse(open(file_path, 'rb'), content_type=content_type)
+
+        return response
@@ -0,0 +1,33 @@
+"""
+Gunicorn configuration for analytics_backend project, read automatically by
+gunicorn analytics_backend.wsgi when it is started from this folder.
+"""
+
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('GUNICORN_WORKERS', 4))
+# threads in every worker, so the admission control queues the analytics requests while the light ones are still served
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+
+# load the application in the master, so the workers share its memory pages after the fork
+preload_app = os.environ.get('GUNICORN_PRELOAD', 'true').lower() == 'true'
+
+
+def when_ready(server):
+    """
+    Warm up the analytics dependencies in the master before the workers are forked
+    """
+    if preload_app:
+        from analytics_backend.warmup import warm_up
+        warm_up()
+
+
+def post_worker_init(worker):
+    """
+    Warm up the analytics dependencies in the worker, when the master didn't load the application.
+    This runs after the worker has loaded the application, unlike post_fork, because the models need Django set up
+    """
+    from analytics_backend.warmup import warm_up
+    warm_up()